@@ -0,0 +1,169 @@
+"""
+Database module - SQLite connection and schema for client memory.
+Profiles, themes, and sessions keep their JSON schema inside `json` columns.
+"""
+
+import json_compat as json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+
+# Directory holding the database (and any legacy JSON store); overridable for the
+# whole process with set_data_root
+DATA_ROOT = Path(os.getenv("THERAPIST_DATA_ROOT", "data"))
+
+# SQLite database file, relative to the data root
+DB_FILENAME = "therapist.db"
+
+# Pre-SQLite JSON store, imported once when the database is first created
+LEGACY_DATA_DIRNAME = "clients"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    client_id TEXT PRIMARY KEY,
+    json TEXT NOT NULL,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS themes (
+    client_id TEXT PRIMARY KEY,
+    json TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    client_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    date TEXT,
+    json TEXT NOT NULL,
+    PRIMARY KEY (client_id, session_id)
+);
+
+CREATE TABLE IF NOT EXISTS session_messages (
+    client_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (client_id, session_id, seq)
+);
+
+CREATE TABLE IF NOT EXISTS session_counters (
+    client_id TEXT PRIMARY KEY,
+    next_num INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS embeddings (
+    content_hash TEXT PRIMARY KEY,
+    vector BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS greetings (
+    cache_key TEXT PRIMARY KEY,
+    text TEXT NOT NULL
+);
+"""
+
+# sqlite3 connections can't be shared across threads, so keep one per thread
+_local = threading.local()
+
+# Process-wide data root override (see set_data_root)
+_data_root = None
+_data_root_lock = threading.Lock()
+
+
+def set_data_root(path: Optional[Path]) -> None:
+    """
+    Point all storage in the process at another data directory (e.g. a temporary one in tests).
+    
+    Each thread's open connection is replaced on its next get_conn call.
+    
+    Args:
+        path: Data directory, or None to go back to DATA_ROOT
+    """
+    global _data_root
+    with _data_root_lock:
+        _data_root = Path(path) if path is not None else None
+
+
+def get_data_root() -> Path:
+    """Return the current data directory."""
+    with _data_root_lock:
+        return _data_root or DATA_ROOT
+
+
+def get_db_path() -> Path:
+    """Return the path of the current database file."""
+    return get_data_root() / DB_FILENAME
+
+
+def get_conn() -> sqlite3.Connection:
+    """
+    Get this thread's database connection, creating the schema on first use.
+        
+    Returns:
+        SQLite connection in WAL mode
+    """
+    db_path = get_db_path()
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        if _local.db_path == db_path:
+            return conn
+        # The data root changed since this thread connected
+        conn.close()
+        _local.conn = None
+    
+    # Only create the data directory when the database doesn't exist yet
+    is_new = not db_path.exists()
+    if is_new:
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    
+    legacy_dir = db_path.parent / LEGACY_DATA_DIRNAME
+    if is_new and legacy_dir.exists():
+        _import_legacy_json(conn, legacy_dir)
+    
+    _local.conn = conn
+    _local.db_path = db_path
+    return conn
+
+
+def _import_legacy_json(conn: sqlite3.Connection, legacy_dir: Path) -> None:
+    """Import profiles, themes, and sessions from the old data/clients/ JSON files."""
+    for client_path in legacy_dir.iterdir():
+        if not client_path.is_dir():
+            continue
+        client_id = client_path.name
+        
+        try:
+            with conn:
+                profile_path = client_path / "profile.json"
+                if profile_path.exists():
+                    profile = json.loads(profile_path.read_text(encoding='utf-8'))
+                    conn.execute(
+                        "INSERT OR IGNORE INTO profiles (client_id, json, updated_at) VALUES (?, ?, ?)",
+                        (client_id, json.dumps(profile), profile.get("last_updated"))
+                    )
+                
+                themes_path = client_path / "themes.json"
+                if themes_path.exists():
+                    conn.execute(
+                        "INSERT OR IGNORE INTO themes (client_id, json) VALUES (?, ?)",
+                        (client_id, themes_path.read_text(encoding='utf-8'))
+                    )
+                
+                for session_path in sorted((client_path / "sessions").glob("session_*.json")):
+                    session = json.loads(session_path.read_text(encoding='utf-8'))
+                    conn.execute(
+                        "INSERT OR IGNORE INTO sessions (client_id, session_id, date, json) VALUES (?, ?, ?, ?)",
+                        (client_id, session_path.stem, session.get("date"),
+                         json.dumps(session))
+                    )
+        except (json.JSONDecodeError, IOError, sqlite3.Error) as e:
+            print(f"Error importing legacy data for {client_id}: {e}")
@@ -0,0 +1,122 @@
+"""
+Embeddings - OpenAI text embeddings with a content-hash cache in SQLite.
+Used to pick relevant themes and sessions locally instead of asking an LLM.
+"""
+
+import os
+import hashlib
+import sqlite3
+import numpy as np
+from openai import OpenAI
+import db
+
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+
+def embed_texts(client: OpenAI, texts: list[str], model: str = None) -> np.ndarray:
+    """
+    Embed texts, only calling the API for content that hasn't been embedded before.
+    
+    Args:
+        client: Initialized OpenAI client
+        texts: Texts to embed
+        model: Embedding model (defaults to EMBEDDING_MODEL)
+        
+    Returns:
+        float32 array of shape (len(texts), dimensions)
+    """
+    model = model or EMBEDDING_MODEL
+    hashes = [_content_hash(model, text) for text in texts]
+    vectors = _load_cached_vectors(hashes)
+    
+    missing = {h: text for h, text in zip(hashes, texts) if h not in vectors}
+    if missing:
+        response = client.embeddings.create(model=model, input=list(missing.values()))
+        new_vectors = {
+            h: np.asarray(item.embedding, dtype=np.float32)
+            for h, item in zip(missing, response.data)
+        }
+        _save_vectors(new_vectors)
+        vectors.update(new_vectors)
+    
+    return np.vstack([vectors[h] for h in hashes])
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Scale each row to unit length, so dot products are cosine similarities.
+    
+    Args:
+        vectors: float32 array, one vector per row
+        
+    Returns:
+        Normalized copy (all-zero rows are left as zeros)
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def top_k_similar(query: np.ndarray, matrix: np.ndarray, k: int,
+                  normalized: bool = False) -> list[tuple[int, float]]:
+    """
+    Find the rows of matrix most cosine-similar to query.
+    
+    Args:
+        query: Query vector
+        matrix: Candidate vectors, one per row
+        k: Maximum number of results
+        normalized: Whether query and matrix rows are already unit length
+        
+    Returns:
+        List of (row index, similarity) pairs, most similar first
+    """
+    if len(matrix) == 0:
+        return []
+    
+    scores = matrix @ query
+    if not normalized:
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        scores = scores / np.where(norms == 0, 1, norms)
+    
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(int(i), float(scores[i])) for i in top]
+
+
+def _content_hash(model: str, text: str) -> str:
+    """Cache key for a (model, text) pair."""
+    return hashlib.sha256(f"{model}\n{text}".encode()).hexdigest()
+
+
+def _load_cached_vectors(hashes: list[str]) -> dict[str, np.ndarray]:
+    """Load stored vectors for the given content hashes."""
+    unique_hashes = list(dict.fromkeys(hashes))
+    if not unique_hashes:
+        return {}
+    
+    placeholders = ", ".join("?" for _ in unique_hashes)
+    try:
+        rows = db.get_conn().execute(
+            f"SELECT content_hash, vector FROM embeddings WHERE content_hash IN ({placeholders})",
+            unique_hashes
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Error loading embeddings: {e}")
+        return {}
+    
+    return {h: np.frombuffer(vector, dtype=np.float32) for h, vector in rows}
+
+
+def _save_vectors(vectors: dict[str, np.ndarray]) -> None:
+    """Store vectors by content hash."""
+    try:
+        conn = db.get_conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (content_hash, vector) VALUES (?, ?)",
+                [(h, vector.tobytes()) for h, vector in vectors.items()]
+            )
+    except sqlite3.Error as e:
+        print(f"Error saving embeddings: {e}")
@@ -0,0 +1,52 @@
+"""
+JSON helpers backed by orjson, mirroring the stdlib json calls used in this project.
+Falls back to the stdlib json module (with the same compact output) if orjson isn't installed.
+"""
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json as _json
+
+
+if orjson is not None:
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so existing handlers still match
+    JSONDecodeError = orjson.JSONDecodeError
+else:
+    JSONDecodeError = _json.JSONDecodeError
+
+
+def dumps(obj, sort_keys: bool = False) -> str:
+    """
+    Serialize obj to a JSON string (UTF-8, non-ASCII kept as-is).
+    
+    Args:
+        obj: Object to serialize
+        sort_keys: Whether to sort dict keys
+        
+    Returns:
+        JSON string
+    """
+    if orjson is None:
+        return _json.dumps(obj, sort_keys=sort_keys, ensure_ascii=False, separators=(",", ":"))
+    
+    option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    return orjson.dumps(obj, option=option).decode()
+
+
+def loads(data):
+    """
+    Deserialize JSON from a str or bytes.
+    
+    Args:
+        data: JSON document
+        
+    Returns:
+        Parsed object
+    """
+    if orjson is None:
+        return _json.loads(data)
+    return orjson.loads(data)
@@ -5,14 +5,19 @@ AI Therapist CLI - Interactive therapy sessions with memory.
 import os
 import sys
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai_client import get_client
 from therapist import Therapist
 import storage
+import db
 
 # Load environment variables
 load_dotenv()
 
+# Background workers for slow LLM work the CLI can overlap with output
+_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
 
 def print_header():
     """Print welcome header."""
@@ -34,17 +39,15 @@ def get_client_id():
     print_separator()
     
     # Check for existing clients
-    data_dir = storage.DATA_DIR
-    if data_dir.exists():
-        existing_clients = [d.name for d in data_dir.iterdir() if d.is_dir()]
-        if existing_clients:
-            print("\nExisting clients:")
-            for i, client in enumerate(existing_clients, 1):
-                # Load profile to show name if available
-                profile = storage.load_profile(client)
-                name = profile.get("basic_info", {}).get("name", "Unknown")
-                sessions = storage.list_sessions(client)
-                print(f"  {i}. {client} ({name}) - {len(sessions)} session(s)")
+    existing_clients = storage.list_clients()
+    if existing_clients:
+        print("\nExisting clients:")
+        for i, client in enumerate(existing_clients, 1):
+            # Load profile to show name if available
+            profile = storage.load_profile(client)
+            name = profile.get("basic_info", {}).get("name", "Unknown")
+            sessions = storage.list_sessions(client)
+            print(f"  {i}. {client} ({name}) - {len(sessions)} session(s)")
     
     print("\nEnter client ID (or press Enter to create new):")
     client_id = input("Client ID: ").strip()
@@ -69,7 +72,7 @@ def get_client_id():
     return client_id
 
 
-def run_session(therapist: Therapist, client_id: str):
+def run_session(therapist: Therapist, client_id: str, defer_extraction: bool = False):
     """Run an interactive therapy session."""
     
     # Start session
@@ -97,8 +100,9 @@ def run_session(therapist: Therapist, client_id: str):
             
             # Get therapist response
             print("\n🤖 Therapist: ", end="", flush=True)
-            response = therapist.send_message(user_input)
-            print(response + "\n")
+            for delta in therapist.stream_message(user_input):
+                print(delta, end="", flush=True)
+            print("\n")
             
         except KeyboardInterrupt:
             print("\n\n⚠️  Session interrupted. Saving progress...")
@@ -107,14 +111,20 @@ def run_session(therapist: Therapist, client_id: str):
             print(f"\n❌ Error: {e}")
             print("Please try again or type 'exit' to end session.\n")
     
-    # End session and save
+    # End session and save; memory extraction runs while the banner prints
     try:
-        summary = therapist.end_session()
+        future = _EXECUTOR.submit(therapist.end_session, defer_extraction)
         
         print("\n" + "=" * 70)
         print("SESSION ENDED")
         print("=" * 70)
         
+        summary = future.result()
+        
+        if not summary['session_id']:
+            print("\n⚠️  The session could not be saved (see the error above).")
+            return
+        
         print(f"\n📊 Session Summary:")
         print(f"   - Session ID: {summary['session_id']}")
         print(f"   - Messages exchanged: {summary['message_count']}")
@@ -123,9 +133,11 @@ def run_session(therapist: Therapist, client_id: str):
         
         if summary.get('summary'):
             print(f"\n   Summary: {summary['summary']}")
+        if defer_extraction:
+            print("\n🕒 Memory extraction deferred; run with --extract-pending to queue it.")
         
         # Show where data is saved
-        print(f"\n💾 Session saved to: data/clients/{client_id}/")
+        print(f"\n💾 Session saved to: {db.get_db_path()} (client {client_id})")
         
         # Show total stats
         profile = storage.load_profile(client_id)
@@ -142,10 +154,60 @@ def run_session(therapist: Therapist, client_id: str):
         print("Your conversation may not have been saved.")
 
 
-def main():
-    """Main entry point."""
+def run_backfill(therapist: Therapist, client_id: str, use_batch: bool = False):
+    """Re-extract memories from every stored session of a client."""
+    sessions = storage.load_sessions(client_id, storage.list_sessions(client_id))
+    transcripts = [transcript for s in sessions if (transcript := s.get("transcript"))]
+    if not transcripts:
+        print(f"\nNo stored transcripts for client {client_id}.")
+        return
     
-    # Parse arguments
+    if use_batch:
+        batch_id = therapist.memory_manager.schedule_batch_extraction(transcripts)
+        if batch_id:
+            print(f"\n🕒 Scheduled batch {batch_id} for {len(transcripts)} session(s).")
+            print("   Run with --poll-batches later to apply the results.")
+        return
+    
+    print(f"\n🔄 Re-extracting memories from {len(transcripts)} session(s)...")
+    # Several transcripts share each request (see MemoryManager.extract_memories_batch)
+    extractions = therapist.memory_manager.extract_many_async(transcripts)
+    
+    # Apply in session order so later sessions win on conflicting facts; the rolling
+    # history already covers these sessions, so it is left as is
+    therapist.memory_manager.apply_extractions(extractions, update_history=False)
+    
+    profile = storage.load_profile(client_id)
+    themes = storage.load_themes(client_id)
+    print(f"✅ Backfill complete")
+    print(f"   - Total facts: {len(profile.get('key_facts', []))}")
+    print(f"   - Total themes: {len(themes.get('recurring_themes', []))}")
+
+
+def run_extract_pending(therapist: Therapist, client_id: str):
+    """Queue deferred session extractions on the Batch API."""
+    batch_id = therapist.memory_manager.schedule_pending_extractions()
+    if batch_id:
+        print(f"\n🕒 Scheduled batch {batch_id} for deferred sessions.")
+        print("   Run with --poll-batches later to apply the results.")
+    else:
+        print("\nNo deferred sessions to extract.")
+
+
+def run_poll_batches(therapist: Therapist, client_id: str):
+    """Apply any finished Batch API extractions."""
+    pending = storage.load_profile(client_id).get("pending_batches", [])
+    if not pending:
+        print("\nNo pending batches.")
+        return
+    
+    applied = therapist.memory_manager.poll_batches()
+    remaining = len(storage.load_profile(client_id).get("pending_batches", []))
+    print(f"\n✅ Applied {applied} extraction(s); {remaining} batch(es) still pending")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the command-line argument parser."""
     parser = argparse.ArgumentParser(
         description="AI Therapist - Memory-aware therapy sessions"
     )
@@ -166,7 +228,39 @@ def main():
         default=None,
         help="Model for memory operations (default: gpt-5-mini)"
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="Re-extract memories from all of the client's stored sessions, then exit"
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="With --backfill, use the Batch API (half price, results within 24h)"
+    )
+    parser.add_argument(
+        "--defer-extraction",
+        action="store_true",
+        help="Save the session without extracting memories; queue them later with --extract-pending"
+    )
+    parser.add_argument(
+        "--extract-pending",
+        action="store_true",
+        help="Queue the client's deferred session extractions on the Batch API, then exit"
+    )
+    parser.add_argument(
+        "--poll-batches",
+        action="store_true",
+        help="Apply finished Batch API extractions for the client, then exit"
+    )
+    return parser
+
+
+def main():
+    """Main entry point."""
+    
+    # Parse arguments
+    args = build_parser().parse_args()
     
     # Print header
     print_header()
@@ -188,7 +282,7 @@ def main():
     
     # Initialize OpenAI client
     try:
-        openai_client = OpenAI(api_key=api_key)
+        openai_client = get_client(api_key)
         print(f"\n✅ Connected to OpenAI (model: {args.model})")
     except Exception as e:
         print(f"\n❌ Error connecting to OpenAI: {e}")
@@ -210,9 +304,19 @@ def main():
         print(f"\n❌ Error initializing therapist: {e}")
         sys.exit(1)
     
+    if args.backfill:
+        run_backfill(therapist, client_id, use_batch=args.batch)
+        return
+    if args.extract_pending:
+        run_extract_pending(therapist, client_id)
+        return
+    if args.poll_batches:
+        run_poll_batches(therapist, client_id)
+        return
+    
     # Run session
     try:
-        run_session(therapist, client_id)
+        run_session(therapist, client_id, defer_extraction=args.defer_extraction)
     except Exception as e:
         print(f"\n❌ Unexpected error: {e}")
         import traceback
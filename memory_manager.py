@@ -2,18 +2,74 @@
 Memory Manager - LLM-powered memory extraction and retrieval.
 """
 
-import json
+import json_compat as json
+import io
 import os
+import re
+import asyncio
+import hashlib
+import threading
+from functools import lru_cache
 from typing import Optional
-from openai import OpenAI
+import numpy as np
+from aiolimiter import AsyncLimiter
+from diskcache import Cache
+from openai import AsyncOpenAI, OpenAI, RateLimitError
+from openai_client import get_async_client
+import db
 import storage
 import prompts
+import embeddings
+
+
+# Facts whose word sets overlap at least this much (Jaccard) count as duplicates
+FACT_SIMILARITY_THRESHOLD = 0.8
+_WORD_RE = re.compile(r"\w+")
+
+# Memories scoring at least this cosine similarity to the message are preloaded
+MEMORY_SIMILARITY_THRESHOLD = 0.4
+MEMORY_TOP_K = 3
+
+# Only this many recent sessions are offered individually; older ones live in the
+# profile's rolling_history summary
+RECENT_SESSION_LIMIT = 10
+MAX_RECALLED_SESSIONS = 3
+
+# Throttling for parallel (backfill) extraction
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "8"))
+REQUESTS_PER_MINUTE = int(os.getenv("REQUESTS_PER_MINUTE", "60"))
+RATE_LIMIT_RETRIES = 5
+
+# Backfill sends this many transcripts per extraction request
+BATCH_EXTRACTION_SIZE = int(os.getenv("BATCH_EXTRACTION_SIZE", "5"))
+
+# On-disk cache of LLM outputs, keyed by a hash of the full request; kept under the
+# data root and opened on first use
+LLM_CACHE_DIRNAME = "llm_cache"
+_llm_caches = {}
+_llm_caches_lock = threading.Lock()
+
+
+def _get_llm_cache() -> Cache:
+    """Return the LLM output cache for the current data root, opening it if needed."""
+    cache_dir = str(db.get_data_root() / LLM_CACHE_DIRNAME)
+    with _llm_caches_lock:
+        if cache_dir not in _llm_caches:
+            _llm_caches[cache_dir] = Cache(cache_dir)
+        return _llm_caches[cache_dir]
+
+
+@lru_cache(maxsize=256)
+def _load_cached_output(cache_dir: str, key: str) -> str:
+    """Read a cached LLM output, keeping hot entries in memory. Raises KeyError on a miss."""
+    return _llm_caches[cache_dir][key]
 
 
 class MemoryManager:
     """Manages memory extraction, storage, and retrieval using LLM."""
     
-    def __init__(self, client_id: str, openai_client: OpenAI, model: str = None):
+    def __init__(self, client_id: str, openai_client: OpenAI, model: str = None,
+                 async_openai_client: Optional[AsyncOpenAI] = None):
         """
         Initialize memory manager.
         
@@ -21,32 +77,362 @@ class MemoryManager:
             client_id: Unique identifier for the client
             openai_client: Initialized OpenAI client
             model: Model to use (defaults to gpt-5-mini)
+            async_openai_client: Client for async extraction (defaults to the shared
+                client for the running event loop)
         """
         self.client_id = client_id
         self.client = openai_client
+        self.async_client = async_openai_client
         self.model = model or os.getenv("MEMORY_MODEL", "gpt-5-mini")
         self.reasoning_effort = os.getenv("REASONING_EFFORT", "low")
         self.verbosity = os.getenv("VERBOSITY", "medium")
+        
+        # In-memory snapshot of stored memory, invalidated on write
+        self._profile_cache = None
+        self._themes_cache = None
+        self._session_ids_cache = None
+        self._session_summaries_cache = None
+        
+        # Normalized embeddings of the similarity candidates, keyed by their texts
+        self._candidate_texts = None
+        self._candidate_matrix = None
     
-    def extract_memories(self, transcript: list[dict]) -> dict:
-        """Extract memories from a session transcript."""
-        transcript_str = prompts.format_transcript_for_extraction(transcript)
-        prompt = prompts.MEMORY_EXTRACTION_PROMPT.format(transcript=transcript_str)
+    def extract_memories(self, transcript: list[dict], prior_summary: str = "") -> dict:
+        """Extract memories from a session transcript (plus a summary of any messages missing from it)."""
+        transcript_str = prompts.format_transcript_for_extraction(transcript, prior_summary)
+        prompt = prompts.format_memory_extraction_prompt(transcript_str)
         
         try:
             extracted = self._call_llm_json(
                 system_msg="You are a therapist reviewing a session to extract important information.",
-                user_msg=prompt
+                user_msg=prompt,
+                json_schema=prompts.EXTRACTION_SCHEMA
             )
             return self._validate_extraction(extracted)
         except Exception as e:
             print(f"Error extracting memories: {e}")
             return self._get_empty_extraction()
     
+    def extract_memories_batch(self, transcripts: list[list[dict]]) -> list[dict]:
+        """Extract memories from several session transcripts with a single LLM call."""
+        if not transcripts:
+            return []
+        
+        try:
+            result = self._call_llm_json(
+                system_msg="You are a therapist reviewing sessions to extract important information.",
+                user_msg=self._batch_extraction_prompt(transcripts),
+                json_schema=prompts.BATCH_EXTRACTION_SCHEMA
+            )
+        except Exception as e:
+            print(f"Error extracting memories: {e}")
+            result = {}
+        
+        return self._batch_extractions(result, len(transcripts))
+    
+    def extract_many_async(self, transcripts: list[list[dict]],
+                           max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+                           rpm: int = REQUESTS_PER_MINUTE,
+                           batch_size: int = BATCH_EXTRACTION_SIZE) -> list[dict]:
+        """
+        Extract memories from many transcripts with concurrent, throttled API calls.
+        
+        Transcripts are sent batch_size at a time, each group as one request like
+        extract_memories_batch; up to max_concurrency requests run at once, limited
+        to rpm requests per minute.
+        
+        Returns:
+            One extraction per transcript, in order
+        """
+        return asyncio.run(self._extract_many(transcripts, max_concurrency, rpm, batch_size))
+    
+    async def _extract_many(self, transcripts: list[list[dict]], max_concurrency: int, rpm: int,
+                            batch_size: int) -> list[dict]:
+        """Fan out batch extraction requests under a semaphore and a requests-per-minute limiter."""
+        semaphore = asyncio.Semaphore(max_concurrency)
+        limiter = AsyncLimiter(rpm, 60)
+        
+        async def extract_chunk(chunk: list[list[dict]]) -> list[dict]:
+            async with semaphore:
+                return await self._extract_batch_async(chunk, limiter)
+        
+        chunks = [transcripts[i:i + batch_size] for i in range(0, len(transcripts), batch_size)]
+        results = await asyncio.gather(*(extract_chunk(chunk) for chunk in chunks))
+        return [extracted for chunk_results in results for extracted in chunk_results]
+    
+    async def _extract_batch_async(self, transcripts: list[list[dict]], limiter: AsyncLimiter) -> list[dict]:
+        """Async counterpart of extract_memories_batch."""
+        try:
+            result = await self._call_llm_json_async(
+                system_msg="You are a therapist reviewing sessions to extract important information.",
+                user_msg=self._batch_extraction_prompt(transcripts),
+                limiter=limiter,
+                json_schema=prompts.BATCH_EXTRACTION_SCHEMA
+            )
+        except Exception as e:
+            print(f"Error extracting memories: {e}")
+            result = {}
+        
+        return self._batch_extractions(result, len(transcripts))
+    
+    def _batch_extraction_prompt(self, transcripts: list[list[dict]]) -> str:
+        """Build the extraction prompt covering several transcripts."""
+        return prompts.format_memory_batch_extraction_prompt(
+            len(transcripts),
+            prompts.format_transcripts_for_batch_extraction(transcripts)
+        )
+    
+    def _batch_extractions(self, result: dict, count: int) -> list[dict]:
+        """Validate a batch extraction result, always returning one extraction per transcript, in order."""
+        extractions = result.get("extractions", [])
+        return [
+            self._validate_extraction(extractions[i]) if i < len(extractions) else self._get_empty_extraction()
+            for i in range(count)
+        ]
+    
+    def schedule_batch_extraction(self, transcripts: list[list[dict]],
+                                  session_ids: Optional[list[str]] = None) -> Optional[str]:
+        """
+        Queue extraction of several transcripts on the OpenAI Batch API.
+        
+        Batch requests cost half as much but may take up to 24h; the batch ID is
+        stored in the profile's pending_batches until poll_batches applies it.
+        If session_ids are given, poll_batches also writes each extraction's
+        summary back to its session.
+        
+        Returns:
+            The batch ID, or None if it couldn't be created
+        """
+        if not transcripts:
+            return None
+        
+        lines = []
+        for i, transcript in enumerate(transcripts):
+            _, body = self._build_llm_request(
+                system_msg="You are a therapist reviewing a session to extract important information.",
+                user_msg=prompts.format_memory_extraction_prompt(
+                    prompts.format_transcript_for_extraction(transcript)
+                ),
+                json_schema=prompts.EXTRACTION_SCHEMA
+            )
+            lines.append(json.dumps({
+                "custom_id": f"{self.client_id}-{i}",
+                "method": "POST",
+                "url": "/v1/responses",
+                "body": body
+            }))
+        
+        try:
+            batch_file = self.client.files.create(
+                file=(f"{self.client_id}_extraction.jsonl", io.BytesIO("\n".join(lines).encode())),
+                purpose="batch"
+            )
+            batch = self.client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint="/v1/responses",
+                completion_window="24h"
+            )
+        except Exception as e:
+            print(f"Error scheduling batch extraction: {e}")
+            return None
+        
+        profile = self._profile()
+        profile.setdefault("pending_batches", []).append(batch.id)
+        if session_ids:
+            profile.setdefault("pending_batch_sessions", {})[batch.id] = session_ids
+        storage.save_profile(self.client_id, profile)
+        self._profile_cache = None
+        return batch.id
+    
+    def schedule_pending_extractions(self) -> Optional[str]:
+        """
+        Queue sessions saved with deferred extraction on the Batch API.
+        
+        Sessions already waiting on a batch are skipped. The stored transcript is the
+        full session (eviction only trims what the model sees), so no evicted summary
+        is passed alongside it.
+        
+        Returns:
+            The batch ID, or None if nothing was scheduled
+        """
+        self.recover_open_sessions()
+        
+        batched = {
+            sid for sids in self._profile().get("pending_batch_sessions", {}).values() for sid in sids
+        }
+        session_ids = [sid for sid in storage.list_pending_extractions(self.client_id) if sid not in batched]
+        sessions = [s for s in storage.load_sessions(self.client_id, session_ids) if s.get("transcript")]
+        if not sessions:
+            return None
+        
+        return self.schedule_batch_extraction(
+            [s["transcript"] for s in sessions],
+            [s["session_id"] for s in sessions]
+        )
+    
+    def recover_open_sessions(self) -> list[str]:
+        """
+        Save sessions whose message log was never turned into a session.
+        
+        A crash or failed save leaves the messages under an open log ID. Each such
+        log is saved as a session with its extraction deferred, so the next
+        schedule_pending_extractions picks it up. Assumes a client has at most one
+        session in progress at a time.
+        
+        Returns:
+            IDs of the recovered sessions
+        """
+        recovered = []
+        for log_id in storage.list_open_logs(self.client_id):
+            session_id = self.save_session({
+                "summary": "",
+                "extracted_facts": [],
+                "themes_discussed": [],
+                "next_session_focus": "",
+                "started_at": log_id[len(storage.OPEN_LOG_PREFIX):],
+                "ended_at": None,
+                "extraction_pending": True,
+                "recovered": True
+            }, log_id)
+            if session_id:
+                recovered.append(session_id)
+        
+        return recovered
+    
+    def poll_batches(self) -> int:
+        """
+        Apply the results of any finished extraction batches.
+        
+        Returns:
+            Number of extractions applied to memory
+        """
+        applied = 0
+        finished = []
+        batch_sessions = self._profile().get("pending_batch_sessions", {})
+        
+        for batch_id in self._profile().get("pending_batches", []):
+            try:
+                batch = self.client.batches.retrieve(batch_id)
+            except Exception as e:
+                print(f"Error checking batch {batch_id}: {e}")
+                continue
+            
+            if batch.status in ("failed", "expired", "cancelled"):
+                print(f"Batch {batch_id} {batch.status}, dropping it")
+                finished.append(batch_id)
+                continue
+            if batch.status != "completed":
+                continue
+            
+            try:
+                output = self.client.files.content(batch.output_file_id).text if batch.output_file_id else ""
+            except Exception as e:
+                print(f"Error downloading batch {batch_id}: {e}")
+                continue
+            
+            session_ids = batch_sessions.get(batch_id, [])
+            extractions = []
+            for index, extracted in self._parse_batch_output(output):
+                extracted = self._validate_extraction(extracted)
+                if index < len(session_ids):
+                    self._complete_deferred_session(session_ids[index], extracted)
+                extractions.append(extracted)
+            
+            # Deferred sessions are new to the rolling history; backfill batches re-extract sessions it already covers
+            self.apply_extractions(extractions, update_history=bool(session_ids))
+            applied += len(extractions)
+            finished.append(batch_id)
+        
+        if finished:
+            profile = self._profile()
+            profile["pending_batches"] = [b for b in profile.get("pending_batches", []) if b not in finished]
+            for batch_id in finished:
+                profile.get("pending_batch_sessions", {}).pop(batch_id, None)
+            storage.save_profile(self.client_id, profile)
+            self._profile_cache = None
+        
+        return applied
+    
+    def _complete_deferred_session(self, session_id: str, extracted: dict) -> None:
+        """Write a batch extraction's results back to the session it was deferred from."""
+        storage.update_session(self.client_id, session_id, {
+            "summary": extracted.get("session_summary", ""),
+            "extracted_facts": extracted.get("new_facts", []),
+            "themes_discussed": [t.get("name", "") for t in extracted.get("themes", [])],
+            "next_session_focus": extracted.get("next_session_focus", ""),
+            "extraction_pending": False
+        })
+        self._session_summaries_cache = None
+    
+    def _parse_batch_output(self, output: str) -> list[tuple[int, dict]]:
+        """Parse extraction JSON from a batch output file as (request index, extraction) pairs, in order."""
+        results = []
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                body = (record.get("response") or {}).get("body") or {}
+                text = "".join(
+                    part.get("text", "")
+                    for item in body.get("output", []) if item.get("type") == "message"
+                    for part in item.get("content", []) if part.get("type") == "output_text"
+                )
+                index = int(record["custom_id"].rsplit("-", 1)[1])
+                results.append((index, json.loads(text)))
+            except (json.JSONDecodeError, KeyError, IndexError, ValueError) as e:
+                print(f"Error parsing batch result: {e}")
+        
+        return sorted(results, key=lambda r: r[0])
+    
     def update_memories(self, extracted_data: dict) -> None:
         """Update profile and themes with extracted data."""
-        profile = storage.load_profile(self.client_id)
-        themes = storage.load_themes(self.client_id)
+        merged = self._merge_extraction(extracted_data)
+        if merged is None:
+            return
+        
+        profile, themes = merged
+        storage.save_profile(self.client_id, profile)
+        storage.save_themes(self.client_id, themes)
+        self._profile_cache = None
+        self._themes_cache = None
+    
+    def apply_extractions(self, extractions: list[dict], update_history: bool = True) -> None:
+        """
+        Update profile and themes with several extractions at once.
+        
+        The extractions are combined in order (so later ones win on conflicting
+        themes and basic info) and merged in a single update, so the rolling
+        history is rolled up once rather than once per extraction.
+        
+        Args:
+            extractions: Extractions in session order
+            update_history: Whether to fold their summaries into the rolling history;
+                pass False when re-extracting sessions the history already covers
+        """
+        combined = {"new_facts": [], "basic_info": {}, "themes": [], "progress_markers": []}
+        summaries = []
+        for extracted in extractions:
+            combined["new_facts"].extend(extracted.get("new_facts") or [])
+            combined["basic_info"].update(extracted.get("basic_info") or {})
+            combined["themes"].extend(extracted.get("themes") or [])
+            combined["progress_markers"].extend(extracted.get("progress_markers") or [])
+            if extracted.get("session_summary"):
+                summaries.append(extracted["session_summary"])
+        
+        if update_history:
+            combined["session_summary"] = "\n\n".join(summaries)
+        
+        self.update_memories(combined)
+    
+    def _merge_extraction(self, extracted_data: dict) -> Optional[tuple[dict, dict]]:
+        """Merge extracted data into the profile and themes, or return None if there's nothing to merge."""
+        memory_keys = ("new_facts", "basic_info", "themes", "progress_markers", "session_summary")
+        if not any(extracted_data.get(k) for k in memory_keys):
+            return None
+        
+        profile = self._profile()
+        themes = self._themes()
         
         if extracted_data.get("new_facts"):
             profile["key_facts"] = self._merge_facts(
@@ -65,95 +451,245 @@ class MemoryManager:
         
         if extracted_data.get("progress_markers"):
             existing_markers = themes.get("progress_markers", [])
+            seen_milestones = {marker.get("milestone", "").lower() for marker in existing_markers}
             for marker in extracted_data["progress_markers"]:
                 if isinstance(marker, str):
                     marker = {"milestone": marker, "date": storage.datetime.now().isoformat()[:10]}
+                # Re-extracting a session reports the same milestones again
+                milestone = marker.get("milestone", "").lower()
+                if milestone in seen_milestones:
+                    continue
+                seen_milestones.add(milestone)
                 existing_markers.append(marker)
             themes["progress_markers"] = existing_markers
         
-        storage.save_profile(self.client_id, profile)
-        storage.save_themes(self.client_id, themes)
+        if extracted_data.get("session_summary"):
+            profile["rolling_history"] = self._roll_up_history(
+                profile.get("rolling_history", ""),
+                extracted_data["session_summary"]
+            )
+        
+        return profile, themes
+    
+    def save_session(self, session_data: dict, log_id: Optional[str] = None,
+                     extracted_data: Optional[dict] = None) -> str:
+        """
+        Save a finished session and refresh the cached session list.
+        
+        If extracted_data is given, it is merged into the profile and themes, which
+        are written in the same transaction as the session.
+        """
+        profile = themes = None
+        if extracted_data:
+            try:
+                merged = self._merge_extraction(extracted_data)
+                if merged is not None:
+                    profile, themes = merged
+            except Exception as e:
+                print(f"Error updating memories: {e}")
+        
+        session_id = storage.save_session(self.client_id, session_data, log_id, profile, themes)
+        
+        # Keep the merged memories even if the session itself couldn't be stored
+        if not session_id and profile is not None:
+            storage.save_profile(self.client_id, profile)
+            storage.save_themes(self.client_id, themes)
+        
+        self._profile_cache = None
+        self._themes_cache = None
+        self._session_ids_cache = None
+        self._session_summaries_cache = None
+        return session_id
+    
+    def get_profile(self) -> dict:
+        """Return the client's profile from the in-memory snapshot (read-only)."""
+        return self._profile()
     
     def get_relevant_context(self, current_message: str) -> dict:
-        """Get relevant memory context for the current message."""
-        profile = storage.load_profile(self.client_id)
-        themes = storage.load_themes(self.client_id)
-        session_ids = storage.list_sessions(self.client_id)
+        """
+        Get candidate memory context for the current message.
+        
+        Themes and sessions whose embeddings are close to the message are preloaded.
+        Everything else is listed in an index the therapist model can pull from
+        in-line through recall_memory.
+        """
+        profile = self._profile()
+        themes = self._themes()
+        session_ids = self._session_ids()[-RECENT_SESSION_LIMIT:]
         
         context = {
             "profile": profile,
+            "available_themes": themes.get("recurring_themes", []),
+            "available_sessions": session_ids,
             "relevant_themes": [],
             "relevant_sessions": []
         }
         
-        if not themes.get("recurring_themes") and not session_ids:
-            return context
-        
-        try:
-            profile_summary = prompts.format_profile_summary(profile)
-            available_themes = prompts.format_available_themes(themes)
-            available_sessions = prompts.format_available_sessions(session_ids)
-            
-            prompt = prompts.MEMORY_RETRIEVAL_PROMPT.format(
-                current_message=current_message,
-                profile_summary=profile_summary,
-                available_themes=available_themes,
-                available_sessions=available_sessions
-            )
-            
-            retrieval = self._call_llm_json(
-                system_msg="You decide which past memories are relevant for therapy conversations.",
-                user_msg=prompt
-            )
-            
-            relevant_theme_names = retrieval.get("relevant_themes", [])
-            if relevant_theme_names:
-                context["relevant_themes"] = [
-                    theme for theme in themes.get("recurring_themes", [])
-                    if theme.get("name") in relevant_theme_names
-                ]
-            
-            relevant_session_ids = retrieval.get("relevant_sessions", [])
-            if relevant_session_ids:
-                context["relevant_sessions"] = [
-                    storage.load_session(self.client_id, sid)
-                    for sid in relevant_session_ids
-                    if storage.load_session(self.client_id, sid) is not None
-                ]
-            
-        except Exception as e:
-            print(f"Error retrieving relevant context: {e}")
-            if session_ids:
-                recent_ids = session_ids[-2:]
-                context["relevant_sessions"] = [
-                    storage.load_session(self.client_id, sid)
-                    for sid in recent_ids
-                    if storage.load_session(self.client_id, sid) is not None
-                ]
+        if context["available_themes"] or session_ids:
+            try:
+                context.update(self._select_similar_memories(current_message))
+            except Exception as e:
+                print(f"Error selecting similar memories: {e}")
         
         return context
     
+    async def get_relevant_context_async(self, current_message: str) -> dict:
+        """Async get_relevant_context; the embedding call and DB reads run in a worker thread."""
+        return await asyncio.to_thread(self.get_relevant_context, current_message)
+    
+    def _select_similar_memories(self, current_message: str) -> dict:
+        """Pick the top-K themes/sessions by embedding similarity to the message."""
+        theme_list = self._themes().get("recurring_themes", [])
+        recent_ids = set(self._session_ids()[-RECENT_SESSION_LIMIT:])
+        # Deferred or failed extractions leave a blank summary, which can't be embedded
+        summaries = {
+            sid: summary for sid, summary in self._session_summaries().items()
+            if sid in recent_ids and summary.strip()
+        }
+        
+        candidates = [("theme", theme.get("name")) for theme in theme_list]
+        candidates += [("session", sid) for sid in summaries]
+        texts = [f"{theme.get('name', '')}: {theme.get('description', '')}" for theme in theme_list]
+        texts += list(summaries.values())
+        
+        # Candidates only change when memory is written, so their matrix is reused across turns
+        if texts != self._candidate_texts:
+            if texts:
+                self._candidate_matrix = embeddings.normalize(embeddings.embed_texts(self.client, texts))
+            else:
+                self._candidate_matrix = np.empty((0, 0), dtype=np.float32)
+            self._candidate_texts = texts
+        
+        query = embeddings.normalize(embeddings.embed_texts(self.client, [current_message]))[0]
+        matches = embeddings.top_k_similar(query, self._candidate_matrix, MEMORY_TOP_K, normalized=True)
+        selected = [candidates[i] for i, score in matches if score >= MEMORY_SIMILARITY_THRESHOLD]
+        
+        return self.recall_memory(
+            [name for kind, name in selected if kind == "theme"],
+            [sid for kind, sid in selected if kind == "session"]
+        )
+    
+    def recall_memory(self, theme_names: list[str], session_ids: list[str]) -> dict:
+        """Load the requested themes and sessions (recall_memory tool callback)."""
+        themes = self._themes()
+        
+        relevant_themes = [
+            theme for theme in themes.get("recurring_themes", [])
+            if theme.get("name") in theme_names
+        ]
+        # Only the summary fields go into the prompt, so transcripts aren't loaded
+        relevant_sessions = storage.load_sessions(
+            self.client_id, session_ids[:MAX_RECALLED_SESSIONS], with_transcript=False
+        )
+        
+        return {
+            "relevant_themes": relevant_themes,
+            "relevant_sessions": relevant_sessions
+        }
+    
     def format_context_for_therapist(self, context: dict) -> str:
         """Format memory context for therapist system prompt."""
         profile = context.get("profile", {})
         relevant_themes = context.get("relevant_themes", [])
         relevant_sessions = context.get("relevant_sessions", [])
+        available_themes = context.get("available_themes", [])
+        available_sessions = context.get("available_sessions", [])
         
         themes_dict = {
             "recurring_themes": relevant_themes,
             "progress_markers": profile.get("progress_markers", [])
         }
         
+        memory_index = ""
+        if available_themes or available_sessions:
+            memory_index = prompts.format_memory_index(
+                {"recurring_themes": available_themes},
+                available_sessions
+            )
+        
         return prompts.format_context_for_therapist(
             profile=profile,
             themes=themes_dict,
-            recent_sessions=relevant_sessions
+            recent_sessions=relevant_sessions,
+            memory_index=memory_index
         )
     
-    def _call_llm_json(self, system_msg: str, user_msg: str) -> dict:
-        """Call LLM with JSON mode using Responses API."""
+    def _profile(self) -> dict:
+        """Return the cached profile, loading it on first use."""
+        if self._profile_cache is None:
+            self._profile_cache = storage.load_profile(self.client_id)
+        return self._profile_cache
+    
+    def _themes(self) -> dict:
+        """Return the cached themes, loading them on first use."""
+        if self._themes_cache is None:
+            self._themes_cache = storage.load_themes(self.client_id)
+        return self._themes_cache
+    
+    def _session_ids(self) -> list[str]:
+        """Return the cached session ID list, loading it on first use."""
+        if self._session_ids_cache is None:
+            self._session_ids_cache = storage.list_sessions(self.client_id)
+        return self._session_ids_cache
+    
+    def _session_summaries(self) -> dict[str, str]:
+        """Return the cached session summaries, loading them on first use."""
+        if self._session_summaries_cache is None:
+            self._session_summaries_cache = storage.load_session_summaries(self.client_id)
+        return self._session_summaries_cache
+    
+    def _call_llm_json(self, system_msg: str, user_msg: str, json_schema: Optional[dict] = None) -> dict:
+        """
+        Call LLM with JSON mode using Responses API, reusing cached outputs for identical requests.
+        
+        If json_schema is given, the output is constrained to it via Structured Outputs.
+        """
+        cache_key, api_params = self._build_llm_request(system_msg, user_msg, json_schema)
+        
+        try:
+            return json.loads(_load_cached_output(_get_llm_cache().directory, cache_key))
+        except KeyError:
+            pass
+        
+        response = self.client.responses.create(**api_params)
+        return self._cache_llm_output(cache_key, response.output_text)
+    
+    async def _call_llm_json_async(self, system_msg: str, user_msg: str, limiter: AsyncLimiter,
+                                   json_schema: Optional[dict] = None) -> dict:
+        """Async _call_llm_json, throttled by limiter with exponential backoff on 429s."""
+        cache_key, api_params = self._build_llm_request(system_msg, user_msg, json_schema)
+        
+        try:
+            return json.loads(_load_cached_output(_get_llm_cache().directory, cache_key))
+        except KeyError:
+            pass
+        
+        async_client = self.async_client or get_async_client(self.client.api_key, str(self.client.base_url))
+        
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            async with limiter:
+                try:
+                    response = await async_client.responses.create(**api_params)
+                    break
+                except RateLimitError:
+                    if attempt == RATE_LIMIT_RETRIES:
+                        raise
+            await asyncio.sleep(2 ** attempt)
+        
+        return self._cache_llm_output(cache_key, response.output_text)
+    
+    def _build_llm_request(self, system_msg: str, user_msg: str, json_schema: Optional[dict]) -> tuple[str, dict]:
+        """Build the cache key and Responses API params for a JSON request."""
         full_input = f"{system_msg}\n\n{user_msg}\n\nRespond with valid JSON only."
         
+        cache_key = hashlib.sha256(json.dumps({
+            "m": self.model,
+            "r": self.reasoning_effort,
+            "v": self.verbosity,
+            "i": full_input,
+            "s": json_schema
+        }, sort_keys=True).encode()).hexdigest()
+        
         api_params = {
             "model": self.model,
             "input": full_input
@@ -164,25 +700,92 @@ class MemoryManager:
             api_params["reasoning"] = {"effort": self.reasoning_effort}
             api_params["text"] = {"verbosity": self.verbosity}
         
-        response = self.client.responses.create(**api_params)
-        return json.loads(response.output_text)
+        if json_schema:
+            api_params.setdefault("text", {})["format"] = {
+                "type": "json_schema",
+                "name": "memory_output",
+                "schema": json_schema,
+                "strict": True
+            }
+        
+        return cache_key, api_params
+    
+    def _cache_llm_output(self, cache_key: str, output_text: str) -> dict:
+        """Parse an LLM output and cache it."""
+        result = json.loads(output_text)
+        
+        # Only cache outputs that parsed, so a malformed reply is retried next time
+        _get_llm_cache().set(cache_key, output_text, expire=None)
+        return result
+    
+    def summarize_evicted(self, summary: str, messages: list[dict]) -> Optional[str]:
+        """
+        Fold messages leaving the conversation window into the running session summary.
+        
+        Returns:
+            The updated summary, or None if it couldn't be generated
+        """
+        try:
+            result = self._call_llm_json(
+                system_msg="You summarize therapy conversations concisely.",
+                user_msg=prompts.format_evicted_summary_prompt(summary, messages),
+                json_schema=prompts.EVICTED_SUMMARY_SCHEMA
+            )
+            return result.get("summary") or None
+        except Exception as e:
+            print(f"Error summarizing evicted messages: {e}")
+            return None
+    
+    def _roll_up_history(self, history: str, session_summary: str) -> str:
+        """Fold a session summary into the rolling history, keeping the old one on failure."""
+        try:
+            result = self._call_llm_json(
+                system_msg="You summarize a client's therapy history concisely.",
+                user_msg=prompts.format_rolling_history_prompt(history, session_summary),
+                json_schema=prompts.ROLLING_HISTORY_SCHEMA
+            )
+            return result.get("rolling_history") or history
+        except Exception as e:
+            print(f"Error updating rolling history: {e}")
+            return history
     
     def _merge_facts(self, existing_facts: list, new_facts: list) -> list:
-        """Merge facts, avoiding duplicates."""
+        """Merge facts, skipping exact (case-insensitive) and near-duplicate matches."""
         merged = existing_facts.copy()
+        seen = {fact.lower() for fact in merged}
+        
+        # Inverted token index so near-duplicate checks only touch facts sharing a word
+        fact_tokens = []
+        token_index = {}
+        for fact in merged:
+            self._index_fact_tokens(fact, fact_tokens, token_index)
         
         for new_fact in new_facts:
             new_fact_lower = new_fact.lower()
-            is_duplicate = any(
-                new_fact_lower in existing.lower() or existing.lower() in new_fact_lower
-                for existing in existing_facts
+            if new_fact_lower in seen:
+                continue
+            
+            new_tokens = set(_WORD_RE.findall(new_fact_lower))
+            candidates = set().union(*(token_index.get(token, ()) for token in new_tokens))
+            is_near_duplicate = any(
+                len(new_tokens & fact_tokens[i]) / len(new_tokens | fact_tokens[i]) >= FACT_SIMILARITY_THRESHOLD
+                for i in candidates
             )
             
-            if not is_duplicate:
+            if not is_near_duplicate:
                 merged.append(new_fact)
+                seen.add(new_fact_lower)
+                self._index_fact_tokens(new_fact, fact_tokens, token_index)
         
         return merged
     
+    def _index_fact_tokens(self, fact: str, fact_tokens: list, token_index: dict) -> None:
+        """Add a fact's word set to the near-duplicate token index."""
+        tokens = set(_WORD_RE.findall(fact.lower()))
+        for token in tokens:
+            token_index.setdefault(token, set()).add(len(fact_tokens))
+        fact_tokens.append(tokens)
+    
     def _merge_themes(self, existing_themes: list, new_themes: list) -> list:
         """Merge themes, updating existing or adding new."""
         themes_dict = {theme["name"]: theme for theme in existing_themes}
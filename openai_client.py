@@ -0,0 +1,59 @@
+"""
+Shared OpenAI clients, one per API key, so every Therapist and MemoryManager in
+the process reuses the same HTTP connection pool.
+"""
+
+import os
+import asyncio
+import threading
+import weakref
+from functools import lru_cache
+from typing import Optional
+from openai import AsyncOpenAI, OpenAI
+
+
+# Per-request timeout in seconds, so a stalled call fails fast instead of waiting out
+# the SDK's 10-minute default
+REQUEST_TIMEOUT = 30.0
+MAX_RETRIES = 2
+
+# AsyncOpenAI connections belong to the event loop that opened them, so async clients
+# are kept per loop and dropped along with it
+_async_clients = weakref.WeakKeyDictionary()
+_async_clients_lock = threading.Lock()
+
+
+def get_client(api_key: Optional[str] = None) -> OpenAI:
+    """
+    Get the shared OpenAI client for an API key.
+    
+    Args:
+        api_key: OpenAI API key (defaults to OPENAI_API_KEY)
+        
+    Returns:
+        Initialized OpenAI client
+    """
+    return _client_for_key(api_key or os.environ["OPENAI_API_KEY"])
+
+
+def get_async_client(api_key: str, base_url: str) -> AsyncOpenAI:
+    """
+    Get the shared AsyncOpenAI client for an API key and endpoint on the running event loop.
+    
+    Must be called from a coroutine; each event loop gets its own client.
+    """
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get((api_key, base_url))
+        if client is None:
+            client = clients[(api_key, base_url)] = AsyncOpenAI(
+                api_key=api_key, base_url=base_url, max_retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT
+            )
+    return client
+
+
+@lru_cache(maxsize=None)
+def _client_for_key(api_key: str) -> OpenAI:
+    """Create the OpenAI client for an API key on first use."""
+    return OpenAI(api_key=api_key, max_retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT)
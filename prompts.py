@@ -2,6 +2,8 @@
 Prompts and context formatting for the AI therapist and memory system.
 """
 
+from typing import Iterator
+
 # System prompt for the therapist
 THERAPIST_SYSTEM_PROMPT = """You are an empathetic and professional AI therapist. Your role is to:
 
@@ -56,117 +58,198 @@ Extract and return as JSON with this exact structure:
 Focus on what would be therapeutically important to remember. Be concise but capture the essence."""
 
 
-# Prompt for deciding which memories to retrieve
-MEMORY_RETRIEVAL_PROMPT = """You are helping decide which past memories are relevant for the current therapy conversation.
+# Prompt for extracting memories from several sessions in one call
+MEMORY_BATCH_EXTRACTION_PROMPT = """You are a therapist reviewing {count} session transcripts from the same client. Extract the information needed to update the client's memory from each transcript separately.
 
-CURRENT USER MESSAGE:
-{current_message}
+{transcripts}
 
-CLIENT PROFILE:
-{profile_summary}
+Return JSON with this exact structure, with one entry per transcript in the order given:
+{{
+  "extractions": [
+    {{
+      "new_facts": ["New factual information about the client"],
+      "updated_facts": ["Updates to existing facts"],
+      "themes": [
+        {{
+          "name": "short_identifier_for_theme",
+          "description": "Brief description of the emotional or behavioral pattern",
+          "intensity": "high|medium|low",
+          "notes": "Specific details or triggers related to this theme"
+        }}
+      ],
+      "session_summary": "2-3 sentence summary of what was discussed and any breakthroughs",
+      "important_moments": ["Particularly significant moments"],
+      "progress_markers": ["Signs of progress or positive changes"],
+      "next_session_focus": "What should be followed up on or explored further next time"
+    }}
+  ]
+}}
 
-AVAILABLE THEMES:
-{available_themes}
+Focus on what would be therapeutically important to remember. Be concise but capture the essence."""
 
-AVAILABLE PAST SESSIONS:
-{available_sessions}
 
-Decide which themes and sessions would be most relevant to recall for this conversation. Return as JSON:
+# Prompt for folding a finished session into the client's long-term history summary
+ROLLING_HISTORY_PROMPT = """You maintain a running summary of a client's therapy history.
+
+CURRENT HISTORY SUMMARY:
+{history}
+
+NEW SESSION SUMMARY:
+{session_summary}
+
+Update the history summary so it also covers the new session. Keep it under 150 words and focus on long-term patterns, progress, and key life events. Return as JSON:
 {{
-  "relevant_themes": ["list of theme names that are relevant"],
-  "relevant_sessions": ["list of session IDs that should be recalled"],
-  "reasoning": "Brief explanation of why these are relevant"
-}}
+  "rolling_history": "The updated history summary"
+}}"""
+
+
+# Prompt for folding messages that drop out of the conversation window into a running summary
+EVICTED_SUMMARY_PROMPT = """You maintain a running summary of an ongoing therapy session.
+
+CURRENT SUMMARY:
+{summary}
+
+MESSAGES LEAVING THE CONVERSATION WINDOW:
+{messages}
+
+Update the summary so it also covers these messages. Keep it under 150 words and keep anything the therapist may need to refer back to later in the session. Return as JSON:
+{{
+  "summary": "The updated session summary"
+}}"""
+
+# Label for the evicted-message summary in conversation and extraction input
+PRIOR_SUMMARY_LABEL = "[Prior conversation summary]"
+
+
+def _split_template(template: str, *fields: str) -> list[str]:
+    """Split a str.format template around the given fields (in order), unescaping braces."""
+    parts = []
+    rest = template
+    for field in fields:
+        head, rest = rest.split("{" + field + "}", 1)
+        parts.append(head)
+    parts.append(rest)
+    return [part.replace("{{", "{").replace("}}", "}") for part in parts]
+
+
+# Templates pre-split at import time, so building a prompt is plain concatenation
+_EXTRACTION_PARTS = _split_template(MEMORY_EXTRACTION_PROMPT, "transcript")
+_BATCH_EXTRACTION_PARTS = _split_template(MEMORY_BATCH_EXTRACTION_PROMPT, "count", "transcripts")
+_ROLLING_HISTORY_PARTS = _split_template(ROLLING_HISTORY_PROMPT, "history", "session_summary")
+_EVICTED_SUMMARY_PARTS = _split_template(EVICTED_SUMMARY_PROMPT, "summary", "messages")
 
-Only include what's truly relevant. It's okay to return empty lists if nothing from the past is particularly relevant to the current message."""
 
+# JSON schema for one extraction, enforced through Structured Outputs
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "new_facts": {"type": "array", "items": {"type": "string"}},
+        "updated_facts": {"type": "array", "items": {"type": "string"}},
+        "themes": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "description": {"type": "string"},
+                    "intensity": {"type": "string", "enum": ["high", "medium", "low"]},
+                    "notes": {"type": "string"}
+                },
+                "required": ["name", "description", "intensity", "notes"],
+                "additionalProperties": False
+            }
+        },
+        "session_summary": {"type": "string"},
+        "important_moments": {"type": "array", "items": {"type": "string"}},
+        "progress_markers": {"type": "array", "items": {"type": "string"}},
+        "next_session_focus": {"type": "string"}
+    },
+    "required": [
+        "new_facts", "updated_facts", "themes", "session_summary",
+        "important_moments", "progress_markers", "next_session_focus"
+    ],
+    "additionalProperties": False
+}
 
-def format_context_for_therapist(profile: dict, themes: dict, recent_sessions: list[dict]) -> str:
+ROLLING_HISTORY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "rolling_history": {"type": "string"}
+    },
+    "required": ["rolling_history"],
+    "additionalProperties": False
+}
+
+EVICTED_SUMMARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"}
+    },
+    "required": ["summary"],
+    "additionalProperties": False
+}
+
+BATCH_EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "extractions": {"type": "array", "items": EXTRACTION_SCHEMA}
+    },
+    "required": ["extractions"],
+    "additionalProperties": False
+}
+
+
+# Tool the therapist model can call in-line to pull full memories from the index
+RECALL_MEMORY_TOOL = {
+    "type": "function",
+    "name": "recall_memory",
+    "description": ("Load full details of past themes and sessions from the client's memory index. "
+                    "Only call this when past context would genuinely help with the current message."),
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "theme_names": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Names of themes from the memory index to recall"
+            },
+            "session_ids": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Session IDs from the memory index to recall"
+            }
+        },
+        "required": ["theme_names", "session_ids"],
+        "additionalProperties": False
+    },
+    "strict": True
+}
+
+
+def format_context_for_therapist(profile: dict, themes: dict, recent_sessions: list[dict],
+                                 memory_index: str = "") -> str:
     """
     Format the memory context to include in the therapist's system prompt.
     
+    Sections are ordered from least to most frequently changing (themes and sessions
+    are selected per message), with dict keys and themes sorted, so the prompt keeps
+    a byte-identical prefix across turns for prompt caching.
+    
     Args:
         profile: Client profile data
         themes: Client themes data
         recent_sessions: List of recent session summaries
+        memory_index: Optional formatted memory index (see format_memory_index)
         
     Returns:
         Formatted context string
     """
-    context_parts = []
-    
-    # Add profile information
-    context_parts.append("=== CLIENT PROFILE ===")
-    
-    if profile.get("basic_info"):
-        info_lines = [f"- {k}: {v}" for k, v in profile["basic_info"].items()]
-        context_parts.append("\n".join(info_lines))
-    
-    if profile.get("key_facts"):
-        context_parts.append("\nKey Facts:")
-        for fact in profile["key_facts"]:
-            context_parts.append(f"• {fact}")
-    
-    if profile.get("current_goals"):
-        context_parts.append("\nCurrent Goals:")
-        for goal in profile["current_goals"]:
-            context_parts.append(f"• {goal}")
-    
-    # Add themes
-    if themes.get("recurring_themes"):
-        context_parts.append("\n=== RECURRING THEMES ===")
-        for theme in themes["recurring_themes"]:
-            context_parts.append(f"\n{theme.get('name', 'Unknown').replace('_', ' ').title()}")
-            context_parts.append(f"  Intensity: {theme.get('intensity', 'unknown')}")
-            if theme.get("notes"):
-                context_parts.append(f"  Notes: {theme['notes']}")
-    
-    # Add progress markers
-    if themes.get("progress_markers"):
-        context_parts.append("\n=== PROGRESS MARKERS ===")
-        for marker in themes["progress_markers"]:
-            date = marker.get("date", "Unknown date")
-            milestone = marker.get("milestone", "")
-            context_parts.append(f"• [{date}] {milestone}")
-    
-    # Add recent session summaries
-    if recent_sessions:
-        context_parts.append("\n=== RECENT SESSIONS ===")
-        for session in recent_sessions:
-            session_id = session.get("session_id", "Unknown")
-            date = session.get("date", "Unknown date")[:10]  # Just the date part
-            summary = session.get("summary", "No summary")
-            context_parts.append(f"\n{session_id} ({date}):")
-            context_parts.append(f"  {summary}")
-    
-    return "\n".join(context_parts)
-
-
-def format_profile_summary(profile: dict) -> str:
-    """
-    Create a brief summary of the profile for memory retrieval decisions.
-    
-    Args:
-        profile: Client profile data
-        
-    Returns:
-        Brief profile summary
-    """
-    parts = []
-    
-    if profile.get("basic_info"):
-        info_str = ", ".join([f"{k}: {v}" for k, v in profile["basic_info"].items()])
-        parts.append(info_str)
-    
-    if profile.get("key_facts"):
-        parts.append(f"Key facts: {'; '.join(profile['key_facts'][:3])}")  # First 3 facts
-    
-    return " | ".join(parts) if parts else "New client, no profile yet"
+    return "\n".join(_iter_context_lines(profile, themes, recent_sessions, memory_index))
 
 
 def format_available_themes(themes: dict) -> str:
     """
-    Format themes list for memory retrieval prompt.
+    Format themes list for the memory index.
     
     Args:
         themes: Client themes data
@@ -178,7 +261,7 @@ def format_available_themes(themes: dict) -> str:
         return "No themes recorded yet"
     
     theme_lines = []
-    for theme in themes["recurring_themes"]:
+    for theme in _sorted_themes(themes["recurring_themes"]):
         name = theme.get("name", "unknown")
         desc = theme.get("description", "")
         theme_lines.append(f"- {name}: {desc}")
@@ -188,7 +271,7 @@ def format_available_themes(themes: dict) -> str:
 
 def format_available_sessions(session_ids: list[str]) -> str:
     """
-    Format session IDs list for memory retrieval prompt.
+    Format session IDs list for the memory index.
     
     Args:
         session_ids: List of session IDs
@@ -202,24 +285,221 @@ def format_available_sessions(session_ids: list[str]) -> str:
     return ", ".join(session_ids)
 
 
-def format_transcript_for_extraction(transcript: list[dict]) -> str:
+def format_memory_index(themes: dict, session_ids: list[str]) -> str:
+    """
+    Format the index of recallable memories for the therapist's system prompt.
+    
+    Args:
+        themes: Client themes data
+        session_ids: List of session IDs
+        
+    Returns:
+        Formatted memory index string
+    """
+    return "\n".join([
+        "\n=== MEMORY INDEX ===",
+        "Use the recall_memory tool to load any of these if they are relevant to the current message.",
+        "\nThemes:",
+        format_available_themes(themes),
+        "\nPast sessions:",
+        format_available_sessions(session_ids)
+    ])
+
+
+def format_recalled_memories(themes: list[dict], sessions: list[dict]) -> str:
+    """
+    Format recalled themes and sessions as the recall_memory tool output.
+    
+    Args:
+        themes: Recalled theme dicts
+        sessions: Recalled session dicts
+        
+    Returns:
+        Formatted recalled memories string
+    """
+    if not themes and not sessions:
+        return "No matching memories found."
+    
+    parts = []
+    for theme in themes:
+        parts.append(f"Theme {theme.get('name', 'unknown')} (intensity: {theme.get('intensity', 'unknown')})")
+        if theme.get("description"):
+            parts.append(f"  Description: {theme['description']}")
+        if theme.get("notes"):
+            parts.append(f"  Notes: {theme['notes']}")
+    
+    for session in sessions:
+        session_id = session.get("session_id", "Unknown")
+        date = session.get("date", "Unknown date")[:10]
+        parts.append(f"Session {session_id} ({date}): {session.get('summary', 'No summary')}")
+        if session.get("themes_discussed"):
+            parts.append(f"  Themes discussed: {', '.join(session['themes_discussed'])}")
+        if session.get("next_session_focus"):
+            parts.append(f"  Follow-up focus: {session['next_session_focus']}")
+    
+    return "\n".join(parts)
+
+
+def format_memory_extraction_prompt(transcript: str) -> str:
+    """
+    Build the memory extraction prompt for one formatted transcript.
+    
+    Args:
+        transcript: Transcript formatted by format_transcript_for_extraction
+        
+    Returns:
+        Prompt string
+    """
+    pre, post = _EXTRACTION_PARTS
+    return f"{pre}{transcript}{post}"
+
+
+def format_memory_batch_extraction_prompt(count: int, transcripts: str) -> str:
+    """
+    Build the batch memory extraction prompt.
+    
+    Args:
+        count: Number of transcripts
+        transcripts: Transcripts formatted by format_transcripts_for_batch_extraction
+        
+    Returns:
+        Prompt string
+    """
+    pre, middle, post = _BATCH_EXTRACTION_PARTS
+    return f"{pre}{count}{middle}{transcripts}{post}"
+
+
+def format_rolling_history_prompt(history: str, session_summary: str) -> str:
+    """
+    Build the prompt for updating the rolling history summary.
+    
+    Args:
+        history: Current history summary (may be empty)
+        session_summary: Summary of the session that just ended
+        
+    Returns:
+        Prompt string
+    """
+    pre, middle, post = _ROLLING_HISTORY_PARTS
+    return f"{pre}{history or 'No history yet'}{middle}{session_summary}{post}"
+
+
+def format_evicted_summary_prompt(summary: str, messages: list[dict]) -> str:
+    """
+    Build the prompt for folding evicted messages into the running session summary.
+    
+    Args:
+        summary: Current summary of earlier evicted messages (may be empty)
+        messages: Messages leaving the conversation window
+        
+    Returns:
+        Prompt string
+    """
+    pre, middle, post = _EVICTED_SUMMARY_PARTS
+    return f"{pre}{summary or 'Nothing yet'}{middle}{format_transcript_for_extraction(messages)}{post}"
+
+
+def format_transcript_for_extraction(transcript: list[dict], prior_summary: str = "") -> str:
     """
     Format conversation transcript for memory extraction.
     
     Args:
         transcript: List of message dicts with 'role' and 'content'
+        prior_summary: Summary of earlier messages no longer in the transcript
         
     Returns:
         Formatted transcript string
     """
-    lines = []
+    lines = _iter_transcript_lines(transcript)
+    if prior_summary:
+        return "\n\n".join([f"{PRIOR_SUMMARY_LABEL}: {prior_summary}", *lines])
+    return "\n\n".join(lines)
+
+
+def format_transcripts_for_batch_extraction(transcripts: list[list[dict]]) -> str:
+    """
+    Format several transcripts, delimited and numbered, for batch extraction.
+    
+    Args:
+        transcripts: List of transcripts, each a list of message dicts
+        
+    Returns:
+        Formatted transcripts string
+    """
+    blocks = []
+    for i, transcript in enumerate(transcripts, 1):
+        blocks.append(f"=== TRANSCRIPT {i} ===\n{format_transcript_for_extraction(transcript)}")
+    
+    return "\n\n".join(blocks)
+
+
+def _sorted_themes(themes: list[dict]) -> list[dict]:
+    """Return themes in a stable order (by name) for byte-identical prompts."""
+    return sorted(themes, key=lambda theme: theme.get("name", ""))
+
+
+def _iter_context_lines(profile: dict, themes: dict, recent_sessions: list[dict],
+                        memory_index: str) -> Iterator[str]:
+    """Yield the lines of the therapist memory context (see format_context_for_therapist)."""
+    # Add profile information
+    yield "=== CLIENT PROFILE ==="
+    
+    if profile.get("basic_info"):
+        yield "\n".join(f"- {k}: {v}" for k, v in sorted(profile["basic_info"].items()))
+    
+    if profile.get("key_facts"):
+        yield "\nKey Facts:"
+        for fact in profile["key_facts"]:
+            yield f"• {fact}"
+    
+    if profile.get("current_goals"):
+        yield "\nCurrent Goals:"
+        for goal in profile["current_goals"]:
+            yield f"• {goal}"
+    
+    # Roll-up of all past sessions; only recent ones are listed individually
+    if profile.get("rolling_history"):
+        yield "\nHistory So Far:"
+        yield profile["rolling_history"]
+    
+    # Add progress markers
+    if themes.get("progress_markers"):
+        yield "\n=== PROGRESS MARKERS ==="
+        for marker in themes["progress_markers"]:
+            date = marker.get("date", "Unknown date")
+            milestone = marker.get("milestone", "")
+            yield f"• [{date}] {milestone}"
+    
+    if memory_index:
+        yield memory_index
+    
+    # Add themes; these and the sessions below are picked per message, so they go last
+    if themes.get("recurring_themes"):
+        yield "\n=== RECURRING THEMES ==="
+        for theme in _sorted_themes(themes["recurring_themes"]):
+            yield f"\n{theme.get('name', 'Unknown').replace('_', ' ').title()}"
+            yield f"  Intensity: {theme.get('intensity', 'unknown')}"
+            if theme.get("notes"):
+                yield f"  Notes: {theme['notes']}"
+    
+    # Add recent session summaries
+    if recent_sessions:
+        yield "\n=== RECENT SESSIONS ==="
+        for session in recent_sessions:
+            session_id = session.get("session_id", "Unknown")
+            date = session.get("date", "Unknown date")[:10]  # Just the date part
+            summary = session.get("summary", "No summary")
+            yield f"\n{session_id} ({date}):"
+            yield f"  {summary}"
+
+
+def _iter_transcript_lines(transcript: list[dict]) -> Iterator[str]:
+    """Yield one formatted line per client/therapist message."""
     for msg in transcript:
         role = msg.get("role", "unknown")
         content = msg.get("content", "")
         
         if role == "user":
-            lines.append(f"Client: {content}")
+            yield f"Client: {content}"
         elif role == "assistant":
-            lines.append(f"Therapist: {content}")
-    
-    return "\n\n".join(lines)
+            yield f"Therapist: {content}"
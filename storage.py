@@ -1,156 +1,235 @@
 """
-Storage module for handling JSON file I/O operations.
-Manages client profiles, themes, and session data.
+Storage module for handling client data persistence.
+Manages client profiles, themes, and session data in SQLite (see db.py).
 """
 
-import json
-from pathlib import Path
+import json_compat as json
+import sqlite3
 from datetime import datetime
 from typing import Optional
+import db
 
 
-# Base data directory
-DATA_DIR = Path("data/clients")
+# Chronological session order: session_999 comes before session_1000
+_SESSION_ORDER = "length(session_id), session_id"
+_SESSION_ORDER_DESC = "length(session_id) DESC, session_id DESC"
 
+# In-progress sessions log their messages under f"{OPEN_LOG_PREFIX}{started_at}"
+# until save_session moves them to the real session ID
+OPEN_LOG_PREFIX = "open_"
 
-def ensure_client_directory(client_id: str) -> Path:
+def list_clients() -> list[str]:
     """
-    Create data/clients/{client_id}/ structure if it doesn't exist.
-    
-    Args:
-        client_id: Unique identifier for the client
+    Return all known client IDs, sorted.
         
     Returns:
-        Path to the client directory
+        List of client IDs that have a profile, themes, or sessions
     """
-    client_path = DATA_DIR / client_id
-    client_path.mkdir(parents=True, exist_ok=True)
-    
-    # Create sessions subdirectory
-    sessions_path = client_path / "sessions"
-    sessions_path.mkdir(exist_ok=True)
-    
-    return client_path
+    try:
+        rows = db.get_conn().execute(
+            "SELECT client_id FROM profiles "
+            "UNION SELECT client_id FROM themes "
+            "UNION SELECT client_id FROM sessions "
+            "ORDER BY client_id"
+        ).fetchall()
+        return [row[0] for row in rows]
+    except sqlite3.Error as e:
+        print(f"Error listing clients: {e}")
+        return []
 
 
 def load_profile(client_id: str) -> dict:
     """
-    Load profile.json for a client.
+    Load the profile for a client.
     
     Args:
         client_id: Unique identifier for the client
         
     Returns:
-        Profile data dict, or empty template if file doesn't exist
+        Profile data dict, or empty template if none is stored
     """
-    ensure_client_directory(client_id)
-    profile_path = DATA_DIR / client_id / "profile.json"
-    
-    if profile_path.exists():
-        try:
-            with open(profile_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error loading profile: {e}")
+    try:
+        row = db.get_conn().execute(
+            "SELECT json FROM profiles WHERE client_id = ?", (client_id,)
+        ).fetchone()
+        if row is None:
             return _get_empty_profile_template(client_id)
-    else:
+        return json.loads(row[0])
+    except (json.JSONDecodeError, sqlite3.Error) as e:
+        print(f"Error loading profile: {e}")
         return _get_empty_profile_template(client_id)
 
 
 def save_profile(client_id: str, profile_data: dict) -> None:
     """
-    Save profile.json for a client.
+    Save the profile for a client.
     
     Args:
         client_id: Unique identifier for the client
         profile_data: Profile data to save
     """
-    ensure_client_directory(client_id)
-    profile_path = DATA_DIR / client_id / "profile.json"
-    
-    # Update timestamp
-    profile_data["last_updated"] = datetime.now().isoformat()
-    
     try:
-        with open(profile_path, 'w', encoding='utf-8') as f:
-            json.dump(profile_data, f, indent=2, ensure_ascii=False)
-    except IOError as e:
+        conn = db.get_conn()
+        with conn:
+            _write_profile(conn, client_id, profile_data)
+    except sqlite3.Error as e:
         print(f"Error saving profile: {e}")
 
 
 def load_themes(client_id: str) -> dict:
     """
-    Load themes.json for a client.
+    Load the themes for a client.
     
     Args:
         client_id: Unique identifier for the client
         
     Returns:
-        Themes data dict, or empty template if file doesn't exist
+        Themes data dict, or empty template if none is stored
     """
-    ensure_client_directory(client_id)
-    themes_path = DATA_DIR / client_id / "themes.json"
-    
-    if themes_path.exists():
-        try:
-            with open(themes_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error loading themes: {e}")
+    try:
+        row = db.get_conn().execute(
+            "SELECT json FROM themes WHERE client_id = ?", (client_id,)
+        ).fetchone()
+        if row is None:
             return _get_empty_themes_template()
-    else:
+        return json.loads(row[0])
+    except (json.JSONDecodeError, sqlite3.Error) as e:
+        print(f"Error loading themes: {e}")
         return _get_empty_themes_template()
 
 
 def save_themes(client_id: str, themes_data: dict) -> None:
     """
-    Save themes.json for a client.
+    Save the themes for a client.
     
     Args:
         client_id: Unique identifier for the client
         themes_data: Themes data to save
     """
-    ensure_client_directory(client_id)
-    themes_path = DATA_DIR / client_id / "themes.json"
-    
     try:
-        with open(themes_path, 'w', encoding='utf-8') as f:
-            json.dump(themes_data, f, indent=2, ensure_ascii=False)
-    except IOError as e:
+        conn = db.get_conn()
+        with conn:
+            _write_themes(conn, client_id, themes_data)
+    except sqlite3.Error as e:
         print(f"Error saving themes: {e}")
 
 
-def save_session(client_id: str, session_data: dict) -> str:
+def list_open_logs(client_id: str) -> list[str]:
     """
-    Save a new session file with auto-generated session ID.
+    Return the message logs of sessions that were started but never saved.
     
     Args:
         client_id: Unique identifier for the client
-        session_data: Session data to save
         
     Returns:
-        The generated session_id (e.g., "session_001")
+        Log IDs (see OPEN_LOG_PREFIX), oldest first
+    """
+    try:
+        rows = db.get_conn().execute(
+            "SELECT DISTINCT session_id FROM session_messages "
+            "WHERE client_id = ? AND substr(session_id, 1, ?) = ? ORDER BY session_id",
+            (client_id, len(OPEN_LOG_PREFIX), OPEN_LOG_PREFIX)
+        ).fetchall()
+        return [row[0] for row in rows]
+    except sqlite3.Error as e:
+        print(f"Error listing open session logs: {e}")
+        return []
+
+
+def append_session_message(client_id: str, log_id: str, seq: int, message: dict) -> None:
     """
-    ensure_client_directory(client_id)
+    Append one message to an in-progress session's log.
     
-    # Get next session number
-    next_num = get_latest_session_number(client_id) + 1
-    session_id = f"session_{next_num:03d}"
+    Args:
+        client_id: Unique identifier for the client
+        log_id: Identifier of the in-progress session's log
+        seq: Position of the message in the session
+        message: Message dict with 'role' and 'content'
+    """
+    try:
+        conn = db.get_conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO session_messages (client_id, session_id, seq, role, content) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (client_id, log_id, seq, message["role"], message["content"])
+            )
+    except sqlite3.Error as e:
+        print(f"Error logging session message: {e}")
+
+
+def load_session_messages(client_id: str, log_id: str) -> list[dict]:
+    """
+    Load the messages logged for a session, in order.
     
-    # Add session_id and date to data
-    session_data["session_id"] = session_id
-    session_data["date"] = datetime.now().isoformat()
+    Args:
+        client_id: Unique identifier for the client
+        log_id: Identifier of the session's log (see append_session_message)
+        
+    Returns:
+        List of message dicts with 'role' and 'content'
+    """
+    try:
+        rows = db.get_conn().execute(
+            "SELECT role, content FROM session_messages WHERE client_id = ? AND session_id = ? ORDER BY seq",
+            (client_id, log_id)
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+    except sqlite3.Error as e:
+        print(f"Error loading session messages: {e}")
+        return []
+
+
+def save_session(client_id: str, session_data: dict, log_id: Optional[str] = None,
+                 profile_data: Optional[dict] = None, themes_data: Optional[dict] = None) -> str:
+    """
+    Save a new session with auto-generated session ID.
     
-    # Save to file
-    session_path = DATA_DIR / client_id / "sessions" / f"{session_id}.json"
+    Args:
+        client_id: Unique identifier for the client
+        session_data: Session data to save
+        log_id: Message log of the session (see append_session_message), used as
+            its transcript instead of session_data["transcript"]
+        profile_data: Updated profile to save in the same transaction
+        themes_data: Updated themes to save in the same transaction
+        
+    Returns:
+        The generated session_id (e.g., "session_001"), or "" if it couldn't be saved
+    """
+    # Add date to data
+    session_data["date"] = datetime.now().isoformat()
     
     try:
-        with open(session_path, 'w', encoding='utf-8') as f:
-            json.dump(session_data, f, indent=2, ensure_ascii=False)
+        conn = db.get_conn()
+        with conn:
+            # Number and insert the session in one write transaction, so concurrent
+            # saves can't claim the same session_id and a failed insert rolls back
+            conn.execute("BEGIN IMMEDIATE")
+            next_num = _claim_session_number(conn, client_id)
+            session_id = f"session_{next_num:03d}"
+            session_data["session_id"] = session_id
+            
+            if log_id is not None:
+                conn.execute(
+                    "UPDATE session_messages SET session_id = ? WHERE client_id = ? AND session_id = ?",
+                    (session_id, client_id, log_id)
+                )
+            
+            conn.execute(
+                "INSERT INTO sessions (client_id, session_id, date, json) VALUES (?, ?, ?, ?)",
+                (client_id, session_id, session_data["date"], json.dumps(session_data))
+            )
+            
+            if profile_data is not None:
+                _write_profile(conn, client_id, profile_data)
+            if themes_data is not None:
+                _write_themes(conn, client_id, themes_data)
         return session_id
-    except IOError as e:
+    except sqlite3.Error as e:
         print(f"Error saving session: {e}")
-        return session_id
+        # The transaction rolled back, so the claimed ID was never stored
+        session_data.pop("session_id", None)
+        return ""
 
 
 def load_session(client_id: str, session_id: str) -> Optional[dict]:
@@ -164,16 +243,76 @@ def load_session(client_id: str, session_id: str) -> Optional[dict]:
     Returns:
         Session data dict, or None if not found
     """
-    session_path = DATA_DIR / client_id / "sessions" / f"{session_id}.json"
+    try:
+        conn = db.get_conn()
+        row = conn.execute(
+            "SELECT json FROM sessions WHERE client_id = ? AND session_id = ?",
+            (client_id, session_id)
+        ).fetchone()
+        if row is None:
+            return None
+        return _attach_transcripts(conn, client_id, [json.loads(row[0])])[0]
+    except (json.JSONDecodeError, sqlite3.Error) as e:
+        print(f"Error loading session {session_id}: {e}")
+        return None
+
+
+def load_sessions(client_id: str, session_ids: list[str], with_transcript: bool = True) -> list[dict]:
+    """
+    Load several sessions by ID with a single query.
     
-    if session_path.exists():
-        try:
-            with open(session_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error loading session {session_id}: {e}")
+    Args:
+        client_id: Unique identifier for the client
+        session_ids: Session identifiers to load
+        with_transcript: Whether to include each session's transcript; without it,
+            only the summary fields are read
+        
+    Returns:
+        Session data dicts in the requested order, skipping IDs that aren't found
+    """
+    unique_ids = list(dict.fromkeys(session_ids))
+    if not unique_ids:
+        return []
+    
+    placeholders = ", ".join("?" for _ in unique_ids)
+    column = "json" if with_transcript else "json_remove(json, '$.transcript')"
+    try:
+        conn = db.get_conn()
+        rows = conn.execute(
+            f"SELECT session_id, {column} FROM sessions WHERE client_id = ? AND session_id IN ({placeholders})",
+            (client_id, *unique_ids)
+        ).fetchall()
+        loaded = {session_id: json.loads(data) for session_id, data in rows}
+        if with_transcript:
+            _attach_transcripts(conn, client_id, list(loaded.values()))
+    except (json.JSONDecodeError, sqlite3.Error) as e:
+        print(f"Error loading sessions: {e}")
+        return []
+    
+    return [loaded[sid] for sid in unique_ids if sid in loaded]
+
+
+def load_latest_session(client_id: str) -> Optional[dict]:
+    """
+    Load the most recent session for a client.
+    
+    Args:
+        client_id: Unique identifier for the client
+        
+    Returns:
+        Session data dict, or None if the client has no sessions
+    """
+    try:
+        conn = db.get_conn()
+        row = conn.execute(
+            f"SELECT json FROM sessions WHERE client_id = ? ORDER BY {_SESSION_ORDER_DESC} LIMIT 1",
+            (client_id,)
+        ).fetchone()
+        if row is None:
             return None
-    else:
+        return _attach_transcripts(conn, client_id, [json.loads(row[0])])[0]
+    except (json.JSONDecodeError, sqlite3.Error) as e:
+        print(f"Error loading latest session: {e}")
         return None
 
 
@@ -187,14 +326,89 @@ def list_sessions(client_id: str) -> list[str]:
     Returns:
         List of session IDs (e.g., ["session_001", "session_002"])
     """
-    sessions_path = DATA_DIR / client_id / "sessions"
+    try:
+        rows = db.get_conn().execute(
+            f"SELECT session_id FROM sessions WHERE client_id = ? ORDER BY {_SESSION_ORDER}",
+            (client_id,)
+        ).fetchall()
+        return [row[0] for row in rows]
+    except sqlite3.Error as e:
+        print(f"Error listing sessions: {e}")
+        return []
+
+
+def load_session_summaries(client_id: str) -> dict[str, str]:
+    """
+    Return each session's summary without loading full transcripts.
+    
+    Args:
+        client_id: Unique identifier for the client
+        
+    Returns:
+        Dict of session ID to summary, sorted chronologically
+    """
+    try:
+        rows = db.get_conn().execute(
+            "SELECT session_id, json_extract(json, '$.summary') FROM sessions "
+            f"WHERE client_id = ? ORDER BY {_SESSION_ORDER}",
+            (client_id,)
+        ).fetchall()
+        return {session_id: summary or "" for session_id, summary in rows}
+    except sqlite3.Error as e:
+        print(f"Error loading session summaries: {e}")
+        return {}
+
+
+def list_pending_extractions(client_id: str) -> list[str]:
+    """
+    Return the sessions saved with their memory extraction deferred.
     
-    if not sessions_path.exists():
+    Args:
+        client_id: Unique identifier for the client
+        
+    Returns:
+        Session IDs whose extraction_pending flag is set, sorted chronologically
+    """
+    try:
+        rows = db.get_conn().execute(
+            "SELECT session_id FROM sessions "
+            "WHERE client_id = ? AND json_extract(json, '$.extraction_pending') = 1 "
+            f"ORDER BY {_SESSION_ORDER}",
+            (client_id,)
+        ).fetchall()
+        return [row[0] for row in rows]
+    except sqlite3.Error as e:
+        print(f"Error listing pending extractions: {e}")
         return []
+
+
+def update_session(client_id: str, session_id: str, fields: dict) -> None:
+    """
+    Merge fields into a stored session.
     
-    # Get all .json files and extract session IDs
-    session_files = sorted(sessions_path.glob("session_*.json"))
-    return [f.stem for f in session_files]
+    Args:
+        client_id: Unique identifier for the client
+        session_id: Session identifier (e.g., "session_001")
+        fields: Keys to set on the session data
+    """
+    try:
+        conn = db.get_conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT json FROM sessions WHERE client_id = ? AND session_id = ?",
+                (client_id, session_id)
+            ).fetchone()
+            if row is None:
+                return
+            session_data = json.loads(row[0])
+            session_data.update(fields)
+            conn.execute(
+                "UPDATE sessions SET json = ? WHERE client_id = ? AND session_id = ?",
+                (json.dumps(session_data), client_id, session_id)
+            )
+    except (json.JSONDecodeError, sqlite3.Error) as e:
+        print(f"Error updating session {session_id}: {e}")
 
 
 def get_latest_session_number(client_id: str) -> int:
@@ -207,19 +421,140 @@ def get_latest_session_number(client_id: str) -> int:
     Returns:
         Latest session number (0 if no sessions exist)
     """
-    sessions = list_sessions(client_id)
+    try:
+        row = db.get_conn().execute(
+            f"SELECT session_id FROM sessions WHERE client_id = ? ORDER BY {_SESSION_ORDER_DESC} LIMIT 1",
+            (client_id,)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Error reading latest session: {e}")
+        return 0
     
-    if not sessions:
+    if row is None:
         return 0
     
     # Extract number from last session_id (e.g., "session_003" -> 3)
-    last_session = sessions[-1]
     try:
-        return int(last_session.split("_")[1])
+        return int(row[0].split("_")[1])
     except (IndexError, ValueError):
         return 0
 
 
+def load_cached_greeting(cache_key: str) -> Optional[str]:
+    """
+    Look up a previously generated greeting.
+    
+    Args:
+        cache_key: Hash of the greeting's inputs
+        
+    Returns:
+        The greeting text, or None on a miss
+    """
+    try:
+        row = db.get_conn().execute(
+            "SELECT text FROM greetings WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        return row[0] if row is not None else None
+    except sqlite3.Error as e:
+        print(f"Error loading cached greeting: {e}")
+        return None
+
+
+def save_cached_greeting(cache_key: str, text: str) -> None:
+    """
+    Store a generated greeting.
+    
+    Args:
+        cache_key: Hash of the greeting's inputs
+        text: Greeting text
+    """
+    try:
+        conn = db.get_conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO greetings (cache_key, text) VALUES (?, ?)",
+                (cache_key, text)
+            )
+    except sqlite3.Error as e:
+        print(f"Error saving cached greeting: {e}")
+
+
+def _write_profile(conn: sqlite3.Connection, client_id: str, profile_data: dict) -> None:
+    """Upsert a profile (inside a transaction), skipping it if nothing but last_updated changed."""
+    row = conn.execute(
+        "SELECT json FROM profiles WHERE client_id = ?", (client_id,)
+    ).fetchone()
+    if row is not None and _is_unchanged_profile(row[0], profile_data):
+        return
+    
+    # Update timestamp
+    profile_data["last_updated"] = datetime.now().isoformat()
+    
+    conn.execute(
+        "INSERT INTO profiles (client_id, json, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(client_id) DO UPDATE SET json = excluded.json, updated_at = excluded.updated_at",
+        (client_id, json.dumps(profile_data), profile_data["last_updated"])
+    )
+
+
+def _write_themes(conn: sqlite3.Connection, client_id: str, themes_data: dict) -> None:
+    """Upsert a client's themes (inside a transaction)."""
+    conn.execute(
+        "INSERT INTO themes (client_id, json) VALUES (?, ?) "
+        "ON CONFLICT(client_id) DO UPDATE SET json = excluded.json",
+        (client_id, json.dumps(themes_data))
+    )
+
+
+def _claim_session_number(conn: sqlite3.Connection, client_id: str) -> int:
+    """Take the next number from the client's session counter (inside a write transaction)."""
+    row = conn.execute(
+        "SELECT next_num FROM session_counters WHERE client_id = ?", (client_id,)
+    ).fetchone()
+    
+    # Seed the counter from existing (e.g. imported) sessions the first time
+    next_num = row[0] if row is not None else get_latest_session_number(client_id) + 1
+    
+    conn.execute(
+        "INSERT INTO session_counters (client_id, next_num) VALUES (?, ?) "
+        "ON CONFLICT(client_id) DO UPDATE SET next_num = excluded.next_num",
+        (client_id, next_num + 1)
+    )
+    return next_num
+
+
+def _attach_transcripts(conn: sqlite3.Connection, client_id: str, sessions: list[dict]) -> list[dict]:
+    """Fill in the transcript of sessions whose messages live in session_messages."""
+    logged = {s["session_id"]: s for s in sessions if "transcript" not in s and "session_id" in s}
+    if not logged:
+        return sessions
+    
+    for session in logged.values():
+        session["transcript"] = []
+    
+    placeholders = ", ".join("?" for _ in logged)
+    rows = conn.execute(
+        "SELECT session_id, role, content FROM session_messages "
+        f"WHERE client_id = ? AND session_id IN ({placeholders}) ORDER BY seq",
+        (client_id, *logged)
+    ).fetchall()
+    for session_id, role, content in rows:
+        logged[session_id]["transcript"].append({"role": role, "content": content})
+    
+    return sessions
+
+
+def _is_unchanged_profile(stored_json: str, profile_data: dict) -> bool:
+    """Check whether profile_data matches the stored profile, ignoring last_updated."""
+    try:
+        stored = json.loads(stored_json)
+    except json.JSONDecodeError:
+        return False
+    
+    stored.pop("last_updated", None)
+    return stored == {k: v for k, v in profile_data.items() if k != "last_updated"}
+
+
 # Template functions
 
 def _get_empty_profile_template(client_id: str) -> dict:
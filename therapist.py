@@ -3,206 +3,505 @@ Therapist - Manages therapy sessions and conversation flow.
 """
 
 import os
+import time
+import hashlib
+import random
+import asyncio
 from datetime import datetime
-from openai import OpenAI
+from typing import Any, Generator, Iterator, Optional
+from openai import APIConnectionError, APITimeoutError, AsyncOpenAI, OpenAI, RateLimitError
 from memory_manager import MemoryManager
+from openai_client import get_async_client, get_client
 import storage
 import prompts
+import json_compat as json
+
+
+# Messages sent verbatim with a full response request. Later turns continue that
+# response server-side, and start over once the chain would span more than
+# HISTORY_WINDOW messages or any of its messages have been evicted
+HISTORY_WINDOW = 20
+
+# Once the transcript grows past the history window, the oldest EVICT_BATCH messages
+# are folded into a running summary, so every message reaches the model either
+# verbatim or summarized
+EVICT_THRESHOLD = HISTORY_WINDOW
+EVICT_BATCH = 10
+
+# Transient API errors are retried with jittered exponential backoff, as long as
+# nothing has been shown to the client yet
+RESPONSE_RETRIES = 2
+_TRANSIENT_ERRORS = (APITimeoutError, APIConnectionError, RateLimitError)
+
+# Separators that start each part of the formatted conversation
+_ROLE_PREFIXES = {"user": "\n\nUser: ", "assistant": "\n\nAssistant: "}
+_SUMMARY_PREFIX = f"\n\n{prompts.PRIOR_SUMMARY_LABEL}: "
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Seconds to wait before retry number attempt + 1 (exponential with full jitter)."""
+    return random.uniform(0, 2 ** attempt)
 
 
 class Therapist:
     """Manages therapy sessions with memory-aware conversations."""
     
-    def __init__(self, client_id: str, openai_client: OpenAI, model: str = None, memory_model: str = None):
+    def __init__(self, client_id: str, openai_client: Optional[OpenAI] = None, model: str = None,
+                 memory_model: str = None, async_openai_client: Optional[AsyncOpenAI] = None):
         """
         Initialize therapist.
         
         Args:
             client_id: Unique identifier for the client
-            openai_client: Initialized OpenAI client
+            openai_client: Initialized OpenAI client (defaults to the shared client)
             model: Model for therapist responses (defaults to gpt-5)
             memory_model: Model for memory operations (defaults to gpt-5-mini)
+            async_openai_client: Client for send_message_async (defaults to the shared
+                client for the running event loop)
         """
         self.client_id = client_id
-        self.client = openai_client
+        self.client = openai_client or get_client()
+        self.async_client = async_openai_client
         self.model = model or os.getenv("THERAPIST_MODEL", "gpt-5")
-        self.memory_manager = MemoryManager(client_id, openai_client, memory_model)
+        self.memory_manager = MemoryManager(client_id, self.client, memory_model, async_openai_client)
         self.reasoning_effort = os.getenv("REASONING_EFFORT", "minimal")
         self.verbosity = os.getenv("VERBOSITY", "medium")
         
+        # Reasoning/verbosity settings only apply to gpt-5 models; built once per Therapist
+        is_gpt5 = self.model.startswith("gpt-5")
+        self._response_extras = {
+            "reasoning": {"effort": self.reasoning_effort},
+            "text": {"verbosity": self.verbosity}
+        } if is_gpt5 else {}
+        self._greeting_extras = {
+            "reasoning": {"effort": "minimal"},
+            "text": {"verbosity": "low"}
+        } if is_gpt5 else {}
+        
         self.current_session = {
             "transcript": [],
             "started_at": None,
+            "evicted_summary": "",
+            "evicted_count": 0,
+            "role_counts": {"user": 0, "assistant": 0},
             "previous_response_id": None
         }
     
     def start_session(self) -> str:
-        """Start a new therapy session."""
+        """
+        Start a new therapy session.
+        
+        Sessions left unsaved by an earlier crash are recovered first (see
+        MemoryManager.recover_open_sessions).
+        """
+        self.memory_manager.recover_open_sessions()
+        
+        started_at = datetime.now().isoformat()
         self.current_session = {
             "transcript": [],
-            "started_at": datetime.now().isoformat()
+            "started_at": started_at,
+            "log_id": f"{storage.OPEN_LOG_PREFIX}{started_at}",
+            "evicted_summary": "",
+            "evicted_count": 0,
+            "role_counts": {"user": 0, "assistant": 0},
+            "previous_response_id": None
         }
         
-        profile = storage.load_profile(self.client_id)
+        profile = self.memory_manager.get_profile()
         is_new_client = not profile.get("key_facts") and not profile.get("basic_info")
         
         greeting = self._generate_new_client_greeting() if is_new_client else self._generate_returning_greeting()
         
-        self.current_session["transcript"].append({
-            "role": "assistant",
-            "content": greeting
-        })
+        self._append_message("assistant", greeting)
         
         return greeting
     
     def send_message(self, user_message: str) -> str:
         """Process user message and generate therapist response."""
+        return "".join(self.stream_message(user_message))
+    
+    def stream_message(self, user_message: str) -> Iterator[str]:
+        """
+        Process user message and stream the therapist response as text deltas.
+        
+        The full response is recorded in the transcript once the stream is exhausted.
+        """
         if not self.current_session.get("started_at"):
             raise RuntimeError("Session not started. Call start_session() first.")
         
-        self.current_session["transcript"].append({
-            "role": "user",
-            "content": user_message
-        })
+        self._append_message("user", user_message)
         
         try:
             context = self.memory_manager.get_relevant_context(user_message)
-            formatted_context = self.memory_manager.format_context_for_therapist(context)
         except Exception as e:
             print(f"Warning: Could not retrieve context: {e}")
-            profile = storage.load_profile(self.client_id)
-            formatted_context = prompts.format_context_for_therapist(profile, {}, [])
+            context = None
         
-        system_prompt = f"{prompts.THERAPIST_SYSTEM_PROMPT}\n\n{formatted_context}"
+        deltas = []
+        response = None
+        try:
+            api_params = self._response_params(context)
+            
+            for attempt in range(RESPONSE_RETRIES + 1):
+                try:
+                    response = yield from self._stream_response(api_params, deltas)
+                    break
+                except _TRANSIENT_ERRORS:
+                    if deltas or attempt == RESPONSE_RETRIES:
+                        raise
+                time.sleep(_backoff_delay(attempt))
+            therapist_response = "".join(deltas)
+            
+            if not therapist_response:
+                response = None
+                therapist_response = "I'm listening. Please tell me more."
+                yield therapist_response
+            
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            response = None
+            if deltas:
+                # Keep what the client has already read rather than starting over
+                therapist_response = "".join(deltas)
+            else:
+                therapist_response = "I'm having trouble processing that right now. Could you tell me more?"
+                yield therapist_response
         
-        # Build conversation text for Responses API
-        recent_transcript = self.current_session["transcript"][-20:]
-        conversation_text = self._format_messages(system_prompt, recent_transcript)
+        self._append_message("assistant", therapist_response)
+        self._advance_chain(response)
+        self._evict_old_messages()
+    
+    async def send_message_async(self, user_message: str) -> str:
+        """
+        Async send_message: retrieves memory context off the event loop and awaits
+        the Responses API on a shared AsyncOpenAI client.
+        """
+        if not self.current_session.get("started_at"):
+            raise RuntimeError("Session not started. Call start_session() first.")
+        
+        self._append_message("user", user_message)
         
         try:
-            # Build API call parameters
-            api_params = {
-                "model": self.model,
-                "input": conversation_text,
-                "max_output_tokens": 500
-            }
-            
-            # Only add reasoning/verbosity for gpt-5 models
-            if self.model.startswith("gpt-5"):
-                api_params["reasoning"] = {"effort": self.reasoning_effort}
-                api_params["text"] = {"verbosity": self.verbosity}
+            context = await self.memory_manager.get_relevant_context_async(user_message)
+        except Exception as e:
+            print(f"Warning: Could not retrieve context: {e}")
+            context = None
+        
+        async_client = self.async_client or get_async_client(self.client.api_key, str(self.client.base_url))
+        response = None
+        try:
+            api_params = self._response_params(context)
             
-            response = self.client.responses.create(**api_params)
+            for attempt in range(RESPONSE_RETRIES + 1):
+                try:
+                    params = api_params
+                    while params:
+                        response = await async_client.responses.create(**params)
+                        params = self._memory_recall_params(response, api_params)
+                    break
+                except _TRANSIENT_ERRORS:
+                    if attempt == RESPONSE_RETRIES:
+                        raise
+                await asyncio.sleep(_backoff_delay(attempt))
             therapist_response = response.output_text
-            
             if not therapist_response:
+                response = None
                 therapist_response = "I'm listening. Please tell me more."
             
         except Exception as e:
             print(f"Error generating response: {e}")
-            try:
-                api_params = {
-                    "model": self.model,
-                    "input": f"{prompts.THERAPIST_SYSTEM_PROMPT}\n\nUser: {user_message}"
-                }
-                
-                if self.model.startswith("gpt-5"):
-                    api_params["reasoning"] = {"effort": "minimal"}
-                    api_params["text"] = {"verbosity": "low"}
-                
-                response = self.client.responses.create(**api_params)
-                therapist_response = response.output_text
-            except Exception as e2:
-                print(f"Retry failed: {e2}")
-                therapist_response = "I'm having trouble processing that right now. Could you tell me more?"
+            response = None
+            therapist_response = "I'm having trouble processing that right now. Could you tell me more?"
         
-        self.current_session["transcript"].append({
-            "role": "assistant",
-            "content": therapist_response
-        })
+        self._append_message("assistant", therapist_response)
+        self._advance_chain(response)
+        await asyncio.to_thread(self._evict_old_messages)
         
         return therapist_response
     
-    def end_session(self) -> dict:
-        """End the current session and save memories."""
+    def end_session(self, defer_extraction: bool = False) -> dict:
+        """
+        End the current session and save memories.
+        
+        With defer_extraction, the session is saved without extracting memories and
+        flagged for a later Batch API run (see MemoryManager.schedule_pending_extractions).
+        """
         if not self.current_session.get("started_at"):
             raise RuntimeError("No active session to end.")
         
         if len(self.current_session["transcript"]) == 0:
             raise RuntimeError("Cannot end empty session.")
         
-        try:
-            extracted = self.memory_manager.extract_memories(
-                self.current_session["transcript"]
-            )
-        except Exception as e:
-            print(f"Error extracting memories: {e}")
-            extracted = {
-                "new_facts": [],
-                "themes": [],
-                "session_summary": "Session completed",
-                "next_session_focus": ""
-            }
-        
-        try:
-            self.memory_manager.update_memories(extracted)
-        except Exception as e:
-            print(f"Error updating memories: {e}")
+        if defer_extraction:
+            extracted = {}
+        else:
+            try:
+                extracted = self.memory_manager.extract_memories(*self._extraction_transcript())
+            except Exception as e:
+                print(f"Error extracting memories: {e}")
+                extracted = {
+                    "new_facts": [],
+                    "themes": [],
+                    "session_summary": "Session completed",
+                    "next_session_focus": ""
+                }
         
+        # The transcript is already in the session's message log
         session_data = {
-            "transcript": self.current_session["transcript"],
+            "evicted_summary": self.current_session.get("evicted_summary", ""),
             "summary": extracted.get("session_summary", ""),
             "extracted_facts": extracted.get("new_facts", []),
             "themes_discussed": [t.get("name", "") for t in extracted.get("themes", [])],
             "next_session_focus": extracted.get("next_session_focus", ""),
             "started_at": self.current_session["started_at"],
-            "ended_at": datetime.now().isoformat()
+            "ended_at": datetime.now().isoformat(),
+            "extraction_pending": defer_extraction
         }
         
-        session_id = storage.save_session(self.client_id, session_data)
+        # Profile, themes, and session are written in one transaction
+        session_id = self.memory_manager.save_session(session_data, self.current_session["log_id"], extracted)
         
         summary = {
             "session_id": session_id,
             "summary": extracted.get("session_summary", ""),
             "facts_learned": len(extracted.get("new_facts", [])),
             "themes_identified": len(extracted.get("themes", [])),
-            "message_count": len(self.current_session["transcript"])
+            "message_count": len(self.current_session["transcript"]) + self.current_session.get("evicted_count", 0)
         }
         
         self.current_session = {
             "transcript": [],
-            "started_at": None
+            "started_at": None,
+            "evicted_summary": "",
+            "evicted_count": 0,
+            "role_counts": {"user": 0, "assistant": 0},
+            "previous_response_id": None
         }
         
         return summary
     
     def get_session_stats(self) -> dict:
         """Get stats about current session."""
-        user_messages = [m for m in self.current_session["transcript"] if m["role"] == "user"]
-        assistant_messages = [m for m in self.current_session["transcript"] if m["role"] == "assistant"]
+        role_counts = self.current_session["role_counts"]
         
         return {
             "is_active": self.current_session.get("started_at") is not None,
-            "message_count": len(self.current_session["transcript"]),
-            "user_messages": len(user_messages),
-            "assistant_messages": len(assistant_messages),
+            "message_count": self._message_count(),
+            "user_messages": role_counts["user"],
+            "assistant_messages": role_counts["assistant"],
             "started_at": self.current_session.get("started_at")
         }
     
-    def _format_messages(self, system_prompt: str, messages: list[dict]) -> str:
-        """Format messages for LLM input."""
-        formatted_parts = [f"System: {system_prompt}"]
+    def _response_params(self, context: Optional[dict]) -> dict:
+        """
+        Build the Responses API request for the current transcript.
         
-        for msg in messages:
-            role = msg.get("role", "")
-            content = msg.get("content", "")
+        Falls back to the bare profile when memory context couldn't be retrieved.
+        While the memory context is unchanged, the request continues the previous
+        response server-side and only sends the new messages.
+        """
+        can_recall = False
+        if context is not None:
+            formatted_context = self.memory_manager.format_context_for_therapist(context)
+            can_recall = bool(context["available_themes"] or context["available_sessions"])
+        else:
+            formatted_context = prompts.format_context_for_therapist(self.memory_manager.get_profile(), {}, [])
+        
+        chained_input = self._chained_input(formatted_context)
+        if chained_input is not None:
+            api_params = {
+                "model": self.model,
+                "input": chained_input,
+                "previous_response_id": self.current_session["previous_response_id"],
+                "max_output_tokens": 500,
+                **self._response_extras
+            }
+            chain_start = self.current_session["chain_start"]
+        else:
+            # Build conversation text for Responses API; older messages are already
+            # in the evicted summary (or kept here if summarizing failed)
+            transcript = self.current_session["transcript"]
             
-            if role == "user":
-                formatted_parts.append(f"User: {content}")
-            elif role == "assistant":
-                formatted_parts.append(f"Assistant: {content}")
+            api_params = {
+                "model": self.model,
+                "input": self._format_messages(
+                    prompts.THERAPIST_SYSTEM_PROMPT,
+                    formatted_context,
+                    transcript,
+                    self.current_session.get("evicted_summary", "")
+                ),
+                "max_output_tokens": 500,
+                **self._response_extras
+            }
+            chain_start = self.current_session["evicted_count"]
+        
+        self.current_session["pending_chain"] = (formatted_context, chain_start)
+        
+        # Memory retrieval happens in-line as a tool call on the same request
+        if can_recall:
+            api_params["tools"] = [prompts.RECALL_MEMORY_TOOL]
+        
+        return api_params
+    
+    def _stream_response(self, api_params: dict, deltas: list[str]) -> Generator[str, None, Any]:
+        """
+        Stream response text deltas (also collected into deltas), answering
+        recall_memory tool calls in-line.
+        
+        Returns:
+            The final response
+        """
+        params = api_params
+        while params:
+            with self.client.responses.stream(**params) as stream:
+                for event in stream:
+                    if event.type == "response.output_text.delta":
+                        deltas.append(event.delta)
+                        yield event.delta
+                response = stream.get_final_response()
+            
+            params = self._memory_recall_params(response, api_params)
+        
+        return response
+    
+    def _chained_input(self, formatted_context: str) -> Optional[str]:
+        """
+        Build the input that continues the previous response, or None if a full
+        request is needed (no previous response, changed context, messages in the
+        chain have been evicted, or the chain would outgrow HISTORY_WINDOW).
+        """
+        session = self.current_session
+        if not session.get("previous_response_id") or session["chain_context"] != formatted_context:
+            return None
+        # Evicted messages must reach the model through the summary, not the chain
+        if session["chain_start"] < session["evicted_count"]:
+            return None
+        if self._message_count() - session["chain_start"] > HISTORY_WINDOW:
+            return None
+        
+        new_start = session["chain_seq"] - session["evicted_count"]
+        return "".join(
+            _ROLE_PREFIXES[msg["role"]] + msg["content"]
+            for msg in session["transcript"][new_start:] if msg["role"] in _ROLE_PREFIXES
+        ).lstrip("\n")
+    
+    def _advance_chain(self, response) -> None:
+        """Continue the next turn from response, or start over if there isn't one."""
+        formatted_context, chain_start = self.current_session.pop("pending_chain", (None, 0))
+        if response is None or formatted_context is None:
+            self.current_session["previous_response_id"] = None
+            return
         
-        return "\n\n".join(formatted_parts)
+        self.current_session.update({
+            "previous_response_id": response.id,
+            "chain_context": formatted_context,
+            "chain_start": chain_start,
+            "chain_seq": self._message_count()
+        })
+    
+    def _memory_recall_params(self, response, api_params: dict) -> Optional[dict]:
+        """Run any recall_memory tool calls locally and build the follow-up request, if needed."""
+        calls = [
+            item for item in response.output
+            if item.type == "function_call" and item.name == "recall_memory"
+        ]
+        if not calls:
+            return None
+        
+        tool_outputs = []
+        for call in calls:
+            # A malformed call recalls nothing rather than failing the turn
+            try:
+                args = json.loads(call.arguments or "{}")
+            except json.JSONDecodeError:
+                args = {}
+            if not isinstance(args, dict):
+                args = {}
+            recalled = self.memory_manager.recall_memory(
+                args.get("theme_names", []),
+                args.get("session_ids", [])
+            )
+            tool_outputs.append({
+                "type": "function_call_output",
+                "call_id": call.call_id,
+                "output": prompts.format_recalled_memories(
+                    recalled["relevant_themes"],
+                    recalled["relevant_sessions"]
+                )
+            })
+        
+        # Continue the same response with the recalled memories; no further recalls
+        return {
+            **api_params,
+            "input": tool_outputs,
+            "previous_response_id": response.id,
+            "tool_choice": "none"
+        }
+    
+    def _format_messages(self, static_system_prompt: str, dynamic_context: str, messages: list[dict],
+                         evicted_summary: str = "") -> str:
+        """
+        Format messages for LLM input.
+        
+        The static system prompt comes first and never changes between turns, so it
+        stays a cacheable prompt prefix; the per-turn memory context follows it.
+        """
+        buf = ["System: ", static_system_prompt, "\n\n---\nContext:\n", dynamic_context, "\n---"]
+        
+        if evicted_summary:
+            buf += (_SUMMARY_PREFIX, evicted_summary)
+        
+        for msg in messages:
+            prefix = _ROLE_PREFIXES.get(msg.get("role", ""))
+            if prefix:
+                buf += (prefix, msg.get("content", ""))
+        
+        return "".join(buf)
+    
+    def _append_message(self, role: str, content: str) -> None:
+        """Add a message to the transcript and the session's on-disk message log."""
+        message = {"role": role, "content": content}
+        seq = self._message_count()
+        self.current_session["transcript"].append(message)
+        self.current_session["role_counts"][role] += 1
+        storage.append_session_message(self.client_id, self.current_session["log_id"], seq, message)
+    
+    def _extraction_transcript(self) -> tuple[list[dict], str]:
+        """
+        Return the whole session for memory extraction, as (transcript, prior summary).
+        
+        Evicted messages are read back from the session's message log; if the log is
+        missing some of them, the retained transcript is used with the evicted summary.
+        """
+        transcript = self.current_session["transcript"]
+        if not self.current_session["evicted_count"]:
+            return transcript, ""
+        
+        logged = storage.load_session_messages(self.client_id, self.current_session["log_id"])
+        if len(logged) == self._message_count():
+            return logged, ""
+        return transcript, self.current_session["evicted_summary"]
+    
+    def _message_count(self) -> int:
+        """Number of messages in the session so far, including evicted ones."""
+        return len(self.current_session["transcript"]) + self.current_session["evicted_count"]
+    
+    def _evict_old_messages(self) -> None:
+        """Fold the oldest messages into the running summary once the transcript is too long."""
+        transcript = self.current_session["transcript"]
+        if len(transcript) <= EVICT_THRESHOLD:
+            return
+        
+        evicted = transcript[:EVICT_BATCH]
+        summary = self.memory_manager.summarize_evicted(self.current_session["evicted_summary"], evicted)
+        
+        # Keep the messages verbatim if they couldn't be summarized
+        if summary is None:
+            return
+        
+        del transcript[:EVICT_BATCH]
+        self.current_session["evicted_summary"] = summary
+        self.current_session["evicted_count"] += len(evicted)
     
     def _generate_new_client_greeting(self) -> str:
         """Generate greeting for new client."""
@@ -212,25 +511,32 @@ class Therapist:
     def _generate_returning_greeting(self) -> str:
         """Generate personalized greeting for returning client."""
         try:
-            profile = storage.load_profile(self.client_id)
-            sessions = storage.list_sessions(self.client_id)
+            profile = self.memory_manager.get_profile()
+            last_session = storage.load_latest_session(self.client_id)
             
             context_parts = []
             
             if profile.get("basic_info", {}).get("name"):
                 context_parts.append(f"Client name: {profile['basic_info']['name']}")
             
-            if sessions:
-                last_session = storage.load_session(self.client_id, sessions[-1])
-                if last_session and last_session.get("next_session_focus"):
-                    context_parts.append(f"Last session we discussed: {last_session.get('summary', 'previous topics')}")
-                    context_parts.append(f"Follow-up focus: {last_session['next_session_focus']}")
+            if last_session and last_session.get("next_session_focus"):
+                context_parts.append(f"Last session we discussed: {last_session.get('summary', 'previous topics')}")
+                context_parts.append(f"Follow-up focus: {last_session['next_session_focus']}")
             
             if not context_parts:
                 return "Welcome back. How have you been since we last spoke?"
             
             context_str = "\n".join(context_parts)
             
+            # Inputs only change when a session ends, so repeat opens reuse the greeting
+            cache_key = hashlib.blake2b(
+                f"{self.client_id}|{last_session.get('session_id', '') if last_session else ''}|"
+                f"{self.model}|{context_str}".encode()
+            ).hexdigest()
+            cached = storage.load_cached_greeting(cache_key)
+            if cached:
+                return cached
+            
             prompt = f"""Generate a warm, brief greeting for a returning therapy client.
 
 Context:
@@ -241,14 +547,13 @@ Keep it natural, empathetic, and brief (1-2 sentences). You can reference what w
             api_params = {
                 "model": self.model,
                 "input": f"You are an empathetic therapist greeting a returning client.\n\n{prompt}",
-                "max_output_tokens": 100
+                "max_output_tokens": 100,
+                **self._greeting_extras
             }
             
-            if self.model.startswith("gpt-5"):
-                api_params["reasoning"] = {"effort": "minimal"}
-                api_params["text"] = {"verbosity": "low"}
-            
             response = self.client.responses.create(**api_params)
+            if response.output_text:
+                storage.save_cached_greeting(cache_key, response.output_text)
             return response.output_text
             
         except Exception as e: